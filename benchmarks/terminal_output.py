@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+"""Terminal Output.
+
+Measures how many bytes gpu-graph writes to the terminal. gpu-graph is run in
+a pseudo terminal of a fixed size, sampling from a fake nvidia-smi, and every
+byte it writes is counted.
+
+For example, to compare plain, braille, and budgeted plots
+
+    python3 benchmarks/terminal_output.py -- -i 0.2
+    python3 benchmarks/terminal_output.py -- -i 0.2 -b
+    python3 benchmarks/terminal_output.py -- -i 0.2 --max-bps 5000
+
+or, to run every case in CASES, including large terminals whose frames don't
+fit in the buffer of a pty,
+
+    python3 benchmarks/terminal_output.py --cases
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+
+Created on:
+    October 18, 2026
+"""
+from argparse import ArgumentParser, REMAINDER
+from tempfile import TemporaryDirectory
+from time import time
+import fcntl
+import os
+import pty
+import select
+import signal
+import struct
+import sys
+import termios
+
+
+# Samples random readings for as many GPUs as FAKE_GPUS says
+FAKE_NVIDIA_SMI = r'''#!{python}
+import os, random, sys
+fields = [a for a in sys.argv if a.startswith('--query-gpu=')][0][12:]
+values = {{'index': str, 'uuid': 'GPU-{{:04d}}'.format,
+          'name': lambda i: 'Tesla V100-SXM2-32GB',
+          'utilization.gpu': lambda i: str(random.randint(0, 100)),
+          'memory.used': lambda i: str(random.randint(0, 32510)),
+          'memory.total': lambda i: '32510'}}
+for i in range(int(os.environ['FAKE_GPUS'])):
+    print(', '.join(values.get(f, lambda i: '[N/A]')(i)
+                    for f in fields.split(',')))
+'''
+
+# Rows, columns, GPUs, and gpu-graph arguments of each case run by --cases
+CASES = [(40, 120, 4, ['-i', '0.2']),
+         (40, 120, 4, ['-i', '0.2', '-b']),
+         (40, 120, 4, ['-i', '0.2', '--max-bps', '5000']),
+         (40, 120, 4, ['-i', '0.2', '--stats']),
+         (100, 300, 8, ['-i', '0.2']),
+         (100, 300, 8, ['-i', '0.2', '--stats']),
+         (100, 300, 8, ['-i', '0.2', '-b', '--max-bps', '20000']),
+         (130, 140, 120, ['-i', '0.2', '--heatmap', '--stats'])]
+
+# Seconds gpu-graph may take to quit before it counts as hung
+QUIT_TIMEOUT = 10
+
+
+def parse_args():
+    p = ArgumentParser(description='measures the bytes gpu-graph writes to '
+                                   'the terminal')
+
+    p.add_argument('-r', '--rows', type=int, default=40,
+                   help='rows of the terminal')
+    p.add_argument('-c', '--cols', type=int, default=120,
+                   help='columns of the terminal')
+    p.add_argument('-g', '--gpus', type=int, default=4,
+                   help='number of fake GPUs')
+    p.add_argument('-d', '--duration', type=float, default=6.,
+                   help='seconds to run gpu-graph for')
+    p.add_argument('--resize', metavar='ROWSxCOLS',
+                   help='resizes the terminal halfway through')
+    p.add_argument('-o', '--output',
+                   help='file to save everything gpu-graph wrote to')
+    p.add_argument('--cases', action='store_true',
+                   help='runs every case in CASES instead')
+    p.add_argument('args', nargs=REMAINDER,
+                   help='arguments for gpu-graph, after --')
+
+    return p.parse_args()
+
+
+def set_size(fd, rows, cols):
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack('HHHH', rows, cols, 0, 0))
+
+
+def measure(args, rows, cols, gpus, duration, resize=None):
+    """Runs gpu-graph in a pseudo terminal and records what it writes.
+
+    :param args: arguments for gpu-graph
+    :param rows: rows of the terminal
+    :param cols: columns of the terminal
+    :param gpus: number of fake GPUs
+    :param duration: seconds to run gpu-graph for before pressing q
+    :param resize: (rows, columns) to resize the terminal to halfway through
+    :type args: list
+    :type rows: int
+    :type cols: int
+    :type gpus: int
+    :type duration: float
+    :type resize: tuple or None
+    :return: Everything gpu-graph wrote to the terminal.
+    :rtype: bytes
+    :raises TimeoutError: If gpu-graph didn't quit, e.g. because it hung.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with TemporaryDirectory() as fake_bin:
+        path = os.path.join(fake_bin, 'nvidia-smi')
+        with open(path, 'w') as f:
+            f.write(FAKE_NVIDIA_SMI.format(python=sys.executable))
+        os.chmod(path, 0o755)
+
+        pid, fd = pty.fork()
+        if pid == 0:
+            os.environ.update({'TERM': 'xterm-256color',
+                               'FAKE_GPUS': str(gpus),
+                               'PATH': fake_bin + ':' + os.environ['PATH'],
+                               'PYTHONPATH': root})
+            os.execv(sys.executable,
+                     [sys.executable, '-c',
+                      'import sys; sys.argv = ["gpu-graph"] + {!r}; '
+                      'from dgxtools.gpu_graph import gpu_graph; '
+                      'gpu_graph()'.format(args)])
+        set_size(fd, rows, cols)
+
+        out = []
+        start = time()
+        quit_sent = False
+        while True:
+            ready, _, _ = select.select([fd], [], [], 0.05)
+            if ready:
+                try:
+                    data = os.read(fd, 65536)
+                except OSError:
+                    break
+                if not data:
+                    break
+                out.append(data)
+            elapsed = time() - start
+            if resize is not None and elapsed > duration / 2:
+                set_size(fd, *resize)
+                resize = None
+            if not quit_sent and elapsed > duration:
+                os.write(fd, b'q')
+                quit_sent = True
+            if elapsed > duration + QUIT_TIMEOUT:
+                break
+        # The pty only closes early if gpu-graph quit
+        hung = time() - start > duration + QUIT_TIMEOUT
+        if hung:
+            os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        os.close(fd)
+    if hung:
+        raise TimeoutError('gpu-graph {} did not quit after {} kB'.format(
+            ' '.join(args), sum(len(data) for data in out) // 1000))
+    return b''.join(out)
+
+
+def run_cases(duration):
+    """Runs every case in CASES.
+
+    :return: Whether gpu-graph quit in every case.
+    :rtype: bool
+    """
+    ok = True
+    for rows, cols, gpus, args in CASES:
+        name = '{}x{}, {} GPUs, {}'.format(cols, rows, gpus, ' '.join(args))
+        try:
+            out = measure(args, rows, cols, gpus, duration)
+        except TimeoutError:
+            print('{:<50} hung'.format(name))
+            ok = False
+            continue
+        print('{:<50} {:>8} bytes {:>7.1f} kB/s'.format(
+            name, len(out), len(out) / duration / 1000))
+    return ok
+
+
+def main():
+    args = parse_args()
+    if args.cases:
+        sys.exit(0 if run_cases(args.duration) else 1)
+    gpu_graph_args = args.args[1:] if args.args[:1] == ['--'] else args.args
+    resize = None
+    if args.resize:
+        resize = tuple(int(x) for x in args.resize.lower().split('x'))
+
+    out = measure(gpu_graph_args, args.rows, args.cols, args.gpus,
+                  args.duration, resize)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(out)
+    print('{} bytes in {:.0f} s, {:.1f} kB/s'.format(
+        len(out), args.duration, len(out) / args.duration / 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,10 @@
 from .gpu_graph import gpu_graph
 from .sgpu import sgpu
 from .container_inspect import container_inspect
+from .gpu_report import gpu_report
+from .gpu_idle import gpu_idle
+from .node_overview import node_overview
+from .gpu_shm import gpu_publish
 
-__all__ = ['gpu_graph', 'sgpu', 'container_inspect']
+__all__ = ['gpu_graph', 'sgpu', 'container_inspect', 'gpu_report',
+           'gpu_idle', 'node_overview', 'gpu_publish']
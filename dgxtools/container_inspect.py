@@ -15,9 +15,18 @@ import json
 from subprocess import Popen, PIPE
 import os
 
+from .topology import (get_cpu_nodes, get_topology, gpu_numa_nodes,
+                       parse_cpu_list, format_cpu_list)
+from .gpu_shm import read_snapshot
+
 
 def get_system_gpus():
-    # Call the nvidia-smi tool
+    # Use the snapshot of gpu-publish if it's running
+    snapshot = read_snapshot()
+    if snapshot is not None:
+        return [{"id": gpu['id'], "uuid": gpu['uuid']} for gpu in snapshot]
+
+    # Otherwise call the nvidia-smi tool
     try:
         p = Popen(['nvidia-smi',
                    '--query-gpu=index,uuid,',
@@ -78,32 +87,63 @@ def get_user(mounts):
     return "Unknown"
 
 
-def get_gpus(env, gpu_list):
-    """Gets GPU IDs given the GPU UUIDs.
+def get_visible_devices(env):
+    """Gets the GPUs made visible to a container.
 
     :param list env: Container environment variables.
-    :param list gpu_list: List of GPUs from GPUtil.
-    :return: List of GPU IDs.
+    :return: The values of NVIDIA_VISIBLE_DEVICES, which are GPU UUIDs, GPU
+        indices, 'all', 'none', or 'void'.
     :rtype: list
     """
-    used_ids = []
-    uuids = []
-
+    devices = []
     for var in env:
         if 'NVIDIA_VISIBLE_DEVICES' in var:
-            var = var.split('=')[1].split(',')
-            for x in var:
-                uuids.append(x)
+            devices += var.split('=')[1].split(',')
+    return devices
+
 
-    if not uuids[0]:
+def get_gpus(env, gpu_list):
+    """Gets GPU IDs given the GPU UUIDs or indices.
+
+    :param list env: Container environment variables.
+    :param list gpu_list: List of GPUs from GPUtil.
+    :return: List of GPU IDs, or '-' if the container has none, and the
+        number of GPUs.
+    :rtype: tuple
+    """
+    used_ids = resolve_devices(get_visible_devices(env), gpu_list)
+
+    if not used_ids:
         return '-', '0'
+    return ', '.join(str(x) for x in used_ids), str(len(used_ids))
+
+
+def resolve_devices(devices, gpu_list):
+    """Resolves values of NVIDIA_VISIBLE_DEVICES into GPU indices.
 
-    for uuid in uuids:
+    :param list devices: GPU UUIDs, GPU indices, 'all', 'none', or 'void'.
+    :param list gpu_list: GPUs, each a dictionary containing 'id' and 'uuid'.
+    :return: The indices of the GPUs in gpu_list the devices refer to,
+        without duplicates. 'none' and 'void' refer to no GPUs.
+    :rtype: list
+    """
+    used_ids = []
+    for device in devices:
         for gpu in gpu_list:
-            if gpu['uuid'] == uuid:
-                used_ids.append(str(gpu['id']))
+            if device in ('all', gpu['uuid'], str(gpu['id'])) \
+                    and gpu['id'] not in used_ids:
+                used_ids.append(gpu['id'])
+    return used_ids
+
 
-    return ', '.join(used_ids), str(len(used_ids))
+def parse_gpu_ids(gpus_used):
+    """Parses the 'GpusUsed' value of a container into GPU indices.
+
+    :param str gpus_used: GPU IDs as returned by get_gpus.
+    :return: The GPU indices, leaving out anything that isn't one.
+    :rtype: list
+    """
+    return [int(x) for x in gpus_used.split(', ') if x.isdigit()]
 
 
 def count_cpus(cpusets):
@@ -156,6 +196,88 @@ def inspect_containers(container_ids, gpu_list):
     return out_list
 
 
+def suggest_cpuset(cpus, gpu_nodes, cpu_nodes, taken):
+    """Suggests a cpuset of the same size on the NUMA nodes of the GPUs.
+
+    CPUs already used by the container are preferred, followed by CPUs not
+    used by any other container.
+
+    :param list cpus: CPUs currently used by the container.
+    :param set gpu_nodes: NUMA nodes the container's GPUs are attached to.
+    :param dict cpu_nodes: CPU to NUMA node mapping.
+    :param set taken: CPUs used by other containers.
+    :return: The suggested cpuset as a cpu list string.
+    :rtype: str
+    """
+    current = set(cpus)
+    candidates = sorted((cpu for cpu, node in cpu_nodes.items()
+                         if node in gpu_nodes),
+                        key=lambda cpu: (cpu not in current, cpu in taken,
+                                         cpu))
+    return format_cpu_list(candidates[:len(cpus)])
+
+
+def check_affinity(info, cpu_nodes, topo):
+    """Finds containers whose CPUs and GPUs are on different NUMA nodes.
+
+    :param list info: Container information from inspect_containers.
+    :param dict cpu_nodes: CPU to NUMA node mapping from get_cpu_nodes.
+    :param dict topo: GPU topology from get_topology.
+    :return: A list of dictionaries containing 'Name', 'CpuNodes', 'GpuNodes',
+        and 'Suggested' for each mismatched container.
+    :rtype: list
+    """
+    container_cpus = [parse_cpu_list(container['CpusUsed'])
+                      for container in info]
+    mismatches = []
+    for i, container in enumerate(info):
+        cpus = container_cpus[i]
+        # Containers without a cpuset or without GPUs can't be mismatched
+        gpu_ids = parse_gpu_ids(container['GpusUsed'])
+        if not cpus or not gpu_ids:
+            continue
+
+        cpu_set_nodes = {cpu_nodes[cpu] for cpu in cpus if cpu in cpu_nodes}
+        gpu_nodes = gpu_numa_nodes(gpu_ids, topo, cpu_nodes)
+        # CPUs on some of the GPUs' nodes are as close as they can be when
+        # the GPUs span more nodes than the CPUs
+        if not cpu_set_nodes or not gpu_nodes \
+                or cpu_set_nodes <= gpu_nodes:
+            continue
+
+        taken = set()
+        for j, other in enumerate(container_cpus):
+            if j != i:
+                taken.update(other)
+
+        suggested = suggest_cpuset(cpus, gpu_nodes, cpu_nodes, taken)
+        if parse_cpu_list(suggested) == cpus:
+            continue
+        mismatches.append({
+            'Name': container['Name'],
+            'CpuNodes': sorted(cpu_set_nodes),
+            'GpuNodes': sorted(gpu_nodes),
+            'Suggested': suggested
+        })
+    return mismatches
+
+
+def output_affinity(mismatches):
+    """Outputs NUMA affinity warnings, if there are any."""
+    if not mismatches:
+        return
+    bold = '\033[1m'
+    norm = '\033[0m'
+    print('{}NUMA affinity warnings:{}\n'.format(bold, norm))
+    for mismatch in mismatches:
+        print('{}: CPUs on node {} but GPUs on node {}. Suggested cpuset: {}'
+              .format(mismatch['Name'],
+                      ','.join(str(n) for n in mismatch['CpuNodes']),
+                      ','.join(str(n) for n in mismatch['GpuNodes']),
+                      mismatch['Suggested']))
+    print('')
+
+
 def output(info):
     """Outputs info nicely in a table."""
     names = [4]
@@ -210,6 +332,13 @@ def container_inspect():
     info = inspect_containers(container_ids, gpu_list)
     output(info)
 
+    # Only machines with more than one NUMA node can have mismatches
+    cpu_nodes = get_cpu_nodes()
+    if len(set(cpu_nodes.values())) > 1:
+        topo = get_topology()
+        if topo is not None:
+            output_affinity(check_affinity(info, cpu_nodes, topo))
+
 
 if __name__ == '__main__':
     container_inspect()
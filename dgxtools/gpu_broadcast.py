@@ -0,0 +1,314 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""GPU Broadcast.
+
+Lets many GPU Graph instances share a single sampler. The server samples the
+GPUs once per interval and sends each sample to every connected client, which
+then draws it using the usual GPU Graph code.
+
+Samples are sent as lines of JSON. A client first receives an 'init' frame
+with the sampled fields, the names of the GPUs, and the recent history, so its
+plots aren't empty at start. After that, each 'delta' frame only contains the
+values that changed since the previous sample.
+
+A client may also connect to the servers of several hosts at once, in which
+case their GPUs are shown together.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+
+Created on:
+    October 18, 2026
+"""
+from collections import deque
+from queue import Queue, Full
+from threading import Thread, Lock
+from time import sleep, time
+import json
+import os
+import socket
+
+from .gpu_graph import FIELDS, SampleBlock, count_gpus
+
+
+# How many frames may wait for a client before it is dropped
+CLIENT_QUEUE = 32
+
+
+def parse_address(address):
+    """Parses an address into a socket family and socket address.
+
+    :param str address: Either HOST:PORT for TCP or the path of a Unix socket.
+    :rtype: tuple
+    """
+    if '/' not in address and ':' in address:
+        host, port = address.rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+def encode(frame):
+    """Encodes a frame as a compact line of JSON."""
+    return (json.dumps(frame, separators=(',', ':')) + '\n').encode('UTF-8')
+
+
+class Client:
+    def __init__(self, connection, on_close):
+        """Creates a Client, which sends frames to one viewer.
+
+        Frames are queued and sent by the client's own thread, so a viewer
+        that stops reading only stalls its own thread.
+
+        :param connection: the connected socket
+        :param on_close: called with the client once it is closed
+        :type connection: socket.socket
+        :type on_close: callable
+        """
+        self.connection = connection
+        self.on_close = on_close
+        self.queue = Queue(CLIENT_QUEUE)
+        self.closed = False
+        Thread(target=self.send_frames, daemon=True).start()
+
+    def put(self, message):
+        """Queues a message, closing the client if its queue is full."""
+        try:
+            self.queue.put_nowait(message)
+        except Full:
+            self.close()
+
+    def send_frames(self):
+        """Sends queued messages until the client is closed."""
+        while not self.closed:
+            message = self.queue.get()
+            if message is None:
+                break
+            try:
+                self.connection.sendall(message)
+            except OSError:
+                break
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            # Wakes up the sending thread if it's stuck in sendall
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.connection.close()
+        try:
+            self.queue.put_nowait(None)
+        except Full:
+            pass
+        self.on_close(self)
+
+
+class GpuServer:
+    def __init__(self, address, fields, interval=1, history=500):
+        """Creates a GpuServer, which broadcasts GPU samples to clients.
+
+        :param address: HOST:PORT or the path of a Unix socket to listen on
+        :param fields: the fields to sample
+        :param interval: how often to sample in seconds
+        :param history: how many samples to send to new clients
+        :type address: str
+        :type fields: list
+        :type interval: int or float
+        :type history: int
+        """
+        self.address = address
+        self.interval = interval
+        self.samples = SampleBlock(fields, count_gpus())
+        assert self.samples.num_gpus > 0, "No GPUs found"
+        # Clients connecting before the first tick still need the GPU names
+        self.samples.sample()
+        self.history = deque(maxlen=history)
+        self.clients = []
+        self.lock = Lock()
+
+    def init_frame(self):
+        """Creates the frame new clients receive first."""
+        return {'type': 'init',
+                'fields': self.samples.fields,
+                'num_gpus': self.samples.num_gpus,
+                'interval': self.interval,
+                'host': socket.gethostname(),
+                'text': {field: self.samples.values[field]
+                         for field in self.samples.text_fields},
+                'history': list(self.history)}
+
+    def serve_forever(self):
+        """Listens for clients and broadcasts samples until interrupted."""
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.unlink(address)
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(address)
+        if family == socket.AF_UNIX:
+            # Anyone on the machine may watch
+            os.chmod(address, 0o666)
+        server.listen()
+
+        accept_thread = Thread(target=self.accept_clients, args=(server,),
+                               daemon=True)
+        accept_thread.start()
+        try:
+            while True:
+                start = time()
+                self.tick()
+                sleep(max(0., self.interval - (time() - start)))
+        finally:
+            server.close()
+            if family == socket.AF_UNIX and os.path.exists(address):
+                os.unlink(address)
+
+    def accept_clients(self, server):
+        """Accepts clients and queues the init frame for them."""
+        while True:
+            connection, _ = server.accept()
+            client = Client(connection, self.remove_client)
+            # The init frame is queued under the lock so that no delta is
+            # missed or queued before it
+            with self.lock:
+                client.put(encode(self.init_frame()))
+                self.clients.append(client)
+
+    def remove_client(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def tick(self):
+        """Takes a sample and sends what changed to every client."""
+        self.samples.sample()
+        frame = self.samples.frame()
+        with self.lock:
+            previous = self.history[-1] if self.history else None
+            # NaN never equals itself, so unchanged NaNs are compared as such
+            changes = [[position, value]
+                       for position, value in enumerate(frame)
+                       if previous is None
+                       or (previous[position] != value
+                           and not (value != value
+                                    and previous[position]
+                                    != previous[position]))]
+            self.history.append(frame)
+            message = encode({'type': 'delta', 't': time(),
+                              'changes': changes})
+            clients = list(self.clients)
+
+        # Only queued here, so a slow client can't hold up the others. Clients
+        # that fall too far behind are dropped.
+        for client in clients:
+            client.put(message)
+
+
+class RemoteSamples(SampleBlock):
+    def __init__(self, address):
+        """Connects to a GpuServer and receives samples from it.
+
+        Each call to sample() waits for and applies the next frame from the
+        server, so the server decides how often the graph updates.
+
+        :param address: HOST:PORT or the path of a Unix socket to connect to
+        :type address: str
+        """
+        family, address = parse_address(address)
+        self.connection = socket.socket(family, socket.SOCK_STREAM)
+        self.connection.connect(address)
+        self.stream = self.connection.makefile('rb')
+
+        init = json.loads(self.stream.readline().decode('UTF-8'))
+        super().__init__(init['fields'], init['num_gpus'])
+        for field, values in init['text'].items():
+            self.values[field][:] = values
+        self.interval = init['interval']
+        self.hosts = [init.get('host', address)] * self.num_gpus
+        self.paced = True
+        self.backlog = init['history']
+        if self.backlog:
+            self.apply(enumerate(self.backlog[-1]))
+
+    def sample(self):
+        """Waits for the next frame from the server and applies it."""
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError('The gpu-graph server has stopped.')
+        self.apply(json.loads(line.decode('UTF-8'))['changes'])
+
+
+class MultiSamples(SampleBlock):
+    def __init__(self, addresses):
+        """Connects to several GpuServers and shows all of their GPUs.
+
+        Each server is read by its own thread, so a slow server doesn't hold
+        up the others. sample() copies the latest values of every server.
+
+        :param addresses: HOST:PORT or the paths of Unix sockets to connect to
+        :type addresses: list
+        """
+        self.remotes = [RemoteSamples(address) for address in addresses]
+        # Only the fields every server samples can be shown
+        fields = [field for field in self.remotes[0].fields
+                  if all(field in remote.fields for remote in self.remotes)]
+        super().__init__(fields, sum(remote.num_gpus
+                                     for remote in self.remotes))
+        self.interval = min(remote.interval for remote in self.remotes)
+        self.hosts = [host for remote in self.remotes for host in remote.hosts]
+        self.lock = Lock()
+        self.error = None
+        # The recent history of every server, aligned to the shortest one so
+        # the newest frames of each line up
+        length = min(len(remote.backlog) for remote in self.remotes)
+        self.backlog = [self.combine(frames) for frames in zip(
+            *(remote.backlog[len(remote.backlog) - length:]
+              for remote in self.remotes))]
+        self.sample()
+
+        for remote in self.remotes:
+            Thread(target=self.receive, args=(remote,), daemon=True).start()
+
+    def combine(self, frames):
+        """Combines one frame of each server into a frame of this block.
+
+        :param frames: a frame from the backlog of each server, in order
+        :type frames: tuple
+        :rtype: list
+        """
+        frame = []
+        for field in self.fields:
+            if FIELDS[field][0] is str:
+                continue
+            for remote, remote_frame in zip(self.remotes, frames):
+                start = remote.fields.index(field) * remote.num_gpus
+                frame.extend(remote_frame[start:start + remote.num_gpus])
+        return frame
+
+    def receive(self, remote):
+        """Keeps applying the frames of one server as they arrive."""
+        try:
+            while True:
+                line = remote.stream.readline()
+                if not line:
+                    raise ConnectionError('A gpu-graph server has stopped.')
+                with self.lock:
+                    remote.apply(json.loads(line.decode('UTF-8'))['changes'])
+        except (ConnectionError, OSError) as e:
+            self.error = e
+
+    def sample(self):
+        """Copies the latest values of every server."""
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            start = 0
+            for remote in self.remotes:
+                end = start + remote.num_gpus
+                for field in self.fields:
+                    self.values[field][start:end] = remote.values[field]
+                start = end
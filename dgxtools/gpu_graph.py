@@ -18,7 +18,21 @@ import argparse
 from threading import Timer
 from sys import exit
 from subprocess import Popen, PIPE
+from array import array
+from bisect import bisect_left
+from collections import deque
+from time import monotonic, perf_counter
+import fcntl
+import mmap
 import os
+import pty
+import signal
+import socket
+import struct
+import termios
+import tty
+
+from .gpu_shm import read_snapshot, SNAPSHOT_KEYS
 
 
 def safe_float_cast(str_number):
@@ -30,7 +44,14 @@ def safe_float_cast(str_number):
 
 
 def get_gpus():
-    # Call the nvidia-smi tool
+    # Use the snapshot of gpu-publish if it's running
+    snapshot = read_snapshot()
+    if snapshot is not None:
+        return [{key: gpu[key] for key in ('load', 'memory_total',
+                                           'memory_used', 'name')}
+                for gpu in snapshot]
+
+    # Otherwise call the nvidia-smi tool
     try:
         p = Popen(['nvidia-smi',
                    '--query-gpu=utilization.gpu,memory.total,memory.used,name',
@@ -56,18 +77,499 @@ def get_gpus():
     return gpus
 
 
+def safe_hex_cast(str_number):
+    try:
+        number = float(int(str_number, 16))
+    except ValueError:
+        number = float('nan')
+    return number
+
+
+# Fields that can be queried from nvidia-smi. Each field has the function used
+# to parse it, the unit to label it with, and the range to plot it in. The top
+# of the range can also be the name of another field holding the limit of each
+# GPU. Fields without a range can't be plotted.
+FIELDS = {
+    'name': (str, '', None),
+    'utilization.gpu': (safe_float_cast, '%', (0, 100)),
+    'utilization.memory': (safe_float_cast, '%', (0, 100)),
+    'memory.used': (safe_float_cast, 'MiB', (0, 'memory.total')),
+    'memory.total': (safe_float_cast, 'MiB', None),
+    'temperature.gpu': (safe_float_cast, 'C', (0, 100)),
+    'temperature.memory': (safe_float_cast, 'C', (0, 100)),
+    'power.draw': (safe_float_cast, 'W', (0, 'power.limit')),
+    'power.limit': (safe_float_cast, 'W', None),
+    'fan.speed': (safe_float_cast, '%', (0, 100)),
+    'clocks.sm': (safe_float_cast, 'MHz', (0, 'clocks.max.sm')),
+    'clocks.max.sm': (safe_float_cast, 'MHz', None),
+    'clocks.mem': (safe_float_cast, 'MHz', (0, 'clocks.max.mem')),
+    'clocks.max.mem': (safe_float_cast, 'MHz', None),
+    'pcie.link.gen.current': (safe_float_cast, '', (0, 'pcie.link.gen.max')),
+    'pcie.link.gen.max': (safe_float_cast, '', None),
+    'pcie.link.width.current': (safe_float_cast, 'x',
+                                (0, 'pcie.link.width.max')),
+    'pcie.link.width.max': (safe_float_cast, 'x', None),
+    'clocks_throttle_reasons.active': (safe_hex_cast, '', None),
+}
+
+# Where gpu-graph servers listen by default
+SERVER_ADDRESS = '/tmp/gpu-graph.sock'
+
+# The fields GpuGraph always needs
+DEFAULT_FIELDS = ['utilization.gpu', 'memory.total', 'memory.used', 'name']
+
+# Bits of clocks_throttle_reasons.active
+THROTTLE_REASONS = [
+    (0x1, 'idle'),
+    (0x2, 'app-clocks'),
+    (0x4, 'sw-power'),
+    (0x8, 'hw-slowdown'),
+    (0x10, 'sync-boost'),
+    (0x20, 'sw-thermal'),
+    (0x40, 'hw-thermal'),
+    (0x80, 'power-brake'),
+    (0x100, 'display-clocks'),
+]
+
+
+def count_gpus():
+    """Counts the GPUs nvidia-smi can see."""
+    snapshot = read_snapshot()
+    if snapshot is not None:
+        return len(snapshot)
+    return len(query_gpus(['index']).split(os.linesep)[:-1])
+
+
+def query_gpus(fields):
+    """Calls nvidia-smi to query the given fields of every GPU.
+
+    :param list fields: Field names from FIELDS.
+    :returns: The raw csv output of nvidia-smi, or an empty string if it is
+        not available.
+    :rtype: str
+    """
+    try:
+        p = Popen(['nvidia-smi',
+                   '--query-gpu=' + ','.join(fields),
+                   '--format=csv,noheader,nounits'],
+                  stdout=PIPE)
+        stdout, stderror = p.communicate()
+    except FileNotFoundError:
+        return ''
+    return stdout.decode('UTF-8')
+
+
+class SampleBlock:
+    def __init__(self, fields, num_gpus):
+        """Holds the latest sample of every GPU, with one array per field.
+
+        Every field is stored in a preallocated array with one slot per GPU,
+        which update() overwrites in place, so taking a sample doesn't build
+        any new containers.
+
+        :param fields: the fields to sample. Fields whose plot range depends
+            on another field pull that field in as well. Text fields are
+            queried last so that commas in them don't break parsing.
+        :param num_gpus: the number of GPUs to hold samples for
+        :type fields: list
+        :type num_gpus: int
+        """
+        wanted = []
+        for field in fields:
+            if field not in FIELDS:
+                raise ValueError('Unknown field: {}'.format(field))
+            wanted.append(field)
+            plot_range = FIELDS[field][2]
+            if plot_range is not None and isinstance(plot_range[1], str):
+                wanted.append(plot_range[1])
+        wanted = list(dict.fromkeys(wanted))
+
+        self.fields = [f for f in wanted if FIELDS[f][0] is not str] \
+            + [f for f in wanted if FIELDS[f][0] is str]
+        self.num_gpus = num_gpus
+        self.values = {}
+        for field in self.fields:
+            if FIELDS[field][0] is str:
+                self.values[field] = [''] * num_gpus
+            else:
+                self.values[field] = array('d', [float('nan')] * num_gpus)
+        self.columns = [self.values[field] for field in self.fields]
+        self.parsers = [FIELDS[field][0] for field in self.fields]
+        self.maxsplit = len(self.fields) - 1
+        self.numeric = [self.values[field] for field in self.fields
+                        if FIELDS[field][0] is not str]
+        self.text_fields = [field for field in self.fields
+                            if FIELDS[field][0] is str]
+
+        # Samples taken before this block existed, as returned by frame(),
+        # and whether sample() waits for the next sample by itself
+        self.backlog = []
+        self.paced = False
+        # The host each GPU belongs to
+        self.hosts = [socket.gethostname()] * num_gpus
+        # Whether the snapshot of gpu-publish has every field
+        self.snapshot_fields = all(field in SNAPSHOT_KEYS
+                                   for field in self.fields)
+
+    @property
+    def plottable(self):
+        """The fields of this block that can be plotted."""
+        return [f for f in self.fields if FIELDS[f][2] is not None]
+
+    def update(self, output):
+        """Parses the output of query_gpus(self.fields) into the arrays.
+
+        :param output: the output of nvidia-smi
+        :type output: str
+        """
+        lines = output.split(os.linesep)
+        for i in range(min(self.num_gpus, len(lines))):
+            vals = lines[i].split(', ', self.maxsplit)
+            for column, parse, val in zip(self.columns, self.parsers, vals):
+                column[i] = parse(val)
+
+    def sample(self):
+        """Samples the GPUs and updates the arrays.
+
+        Reads the snapshot of gpu-publish instead of running nvidia-smi if it
+        has every field.
+        """
+        snapshot = read_snapshot() if self.snapshot_fields else None
+        if snapshot is None or len(snapshot) != self.num_gpus:
+            self.update(query_gpus(self.fields))
+            return
+        for field in self.fields:
+            column = self.values[field]
+            key = SNAPSHOT_KEYS[field]
+            for i, gpu in enumerate(snapshot):
+                column[i] = gpu[key]
+        if 'utilization.gpu' in self.values:
+            # Snapshots hold the load as a fraction
+            column = self.values['utilization.gpu']
+            for i in range(self.num_gpus):
+                column[i] *= 100
+
+    def frame(self):
+        """Gets every numeric value, field by field, as one flat list."""
+        frame = []
+        for column in self.numeric:
+            frame.extend(column)
+        return frame
+
+    def frame_value(self, frame, field, i):
+        """Gets the value of a field of GPU i from a frame."""
+        return frame[self.fields.index(field) * self.num_gpus + i]
+
+    def apply(self, changes):
+        """Applies (position, value) pairs of a flat frame to the arrays."""
+        for position, value in changes:
+            self.numeric[position // self.num_gpus][position
+                                                   % self.num_gpus] = value
+
+    def plot_range(self, field, i):
+        """Gets the minimum and maximum to plot a field of GPU i with."""
+        minimum, maximum = FIELDS[field][2]
+        if isinstance(maximum, str):
+            maximum = self.values[maximum][i]
+        return minimum, maximum
+
+
+# Shades and colors of heatmap cells, from idle to fully utilized
+HEATMAP_LEVELS = [(' ', 0), ('░', 5), ('▒', 3), ('▓', 4), ('█', 2)]
+
+# Bits of each dot of a braille character, by column and then row from the top
+BRAILLE_DOTS = ((0x01, 0x02, 0x04, 0x40), (0x08, 0x10, 0x20, 0x80))
+
+# Bytes written to the terminal, as counted by CountedOutput
+COUNTER = struct.Struct('Q')
+
+
+class CountedOutput:
+    def __init__(self):
+        """Counts the bytes curses writes to the terminal.
+
+        curses writes straight to stdout, so while counting, stdout is a
+        pseudo terminal. A child process copies everything written to it on
+        to the real terminal and counts the bytes on the way. It has to be a
+        process rather than a thread: curses keeps the interpreter lock while
+        it writes, so a thread couldn't empty a full pty.
+        """
+        # Total bytes copied so far, shared with the child process
+        self.counter = mmap.mmap(-1, COUNTER.size)
+        self.terminal = None
+        self.input_mode = None
+        self.pid = None
+
+    @property
+    def written(self):
+        return COUNTER.unpack_from(self.counter)[0]
+
+    def start(self):
+        """Puts the pseudo terminal between stdout and the terminal.
+
+        Must be called before curses is initialized and before any threads
+        are started, since it forks.
+        """
+        self.terminal = os.dup(1)
+        master, slave = pty.openpty()
+        termios.tcsetattr(slave, termios.TCSANOW,
+                          termios.tcgetattr(self.terminal))
+        self.pid = os.fork()
+        if self.pid == 0:
+            try:
+                os.close(slave)
+                self.copy(master)
+            finally:
+                os._exit(0)
+        os.close(master)
+        os.dup2(slave, 1)
+        os.close(slave)
+        self.resize()
+        # curses sets the modes of stdout, so those of the terminal that keys
+        # are read from are set here
+        if os.isatty(0):
+            self.input_mode = termios.tcgetattr(0)
+            tty.setcbreak(0)
+
+    def copy(self, master):
+        """Copies the output to the terminal until stdout is restored."""
+        # Ctrl-C is meant for gpu-graph, which restores stdout when it exits
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        written = 0
+        while True:
+            try:
+                data = os.read(master, 65536)
+            except OSError:
+                break
+            if not data:
+                break
+            written += len(data)
+            while data:
+                data = data[os.write(self.terminal, data):]
+            COUNTER.pack_into(self.counter, 0, written)
+
+    def resize(self):
+        """Gives the pseudo terminal the size of the terminal."""
+        size = fcntl.ioctl(self.terminal, termios.TIOCGWINSZ, bytes(8))
+        fcntl.ioctl(1, termios.TIOCSWINSZ, size)
+
+    def handle_resize(self, signum, frame):
+        """Handles SIGWINCH, which curses can't see through the pty."""
+        self.resize()
+        size = os.get_terminal_size(1)
+        curses.resizeterm(size.lines, size.columns)
+        curses.ungetch(KEY_RESIZE)
+
+    def stop(self):
+        """Restores stdout and the mode of the terminal."""
+        # Closing the last end of the pty lets the child copy what's left
+        # and exit
+        os.dup2(self.terminal, 1)
+        os.waitpid(self.pid, 0)
+        os.close(self.terminal)
+        if self.input_mode is not None:
+            termios.tcsetattr(0, termios.TCSADRAIN, self.input_mode)
+
+
+class FrameStats:
+    def __init__(self, output=None, period=5.):
+        """Keeps track of how long frames take and how much they output.
+
+        :param output: what counts the bytes written to the terminal, or None
+            to only time frames
+        :param period: the number of seconds to average bytes per second over
+        :type output: CountedOutput or None
+        :type period: float
+        """
+        self.output = output
+        self.period = period
+        self.frames = deque()
+        self.frame_bytes = 0
+        self.frame_time = 0.
+        self.started = 0.
+        self.written = 0
+
+    def start(self):
+        """Starts measuring a frame."""
+        self.started = perf_counter()
+
+    def end(self):
+        """Ends measuring a frame."""
+        self.frame_time = perf_counter() - self.started
+        if self.output is not None:
+            # The pty hands output over asynchronously, so bytes may be
+            # counted a frame late, but none are missed. This also counts
+            # what was written between frames, e.g. on resize.
+            written = self.output.written
+            self.frame_bytes = written - self.written
+            self.written = written
+        now = monotonic()
+        self.frames.append((now, self.frame_bytes))
+        while self.frames[0][0] < now - self.period:
+            self.frames.popleft()
+
+    @property
+    def bytes_per_second(self):
+        return sum(b for _, b in self.frames) / self.period
+
+
+class ByteBudget:
+    def __init__(self, rate):
+        """Limits how many bytes per second are written to the terminal.
+
+        Frames may go over budget, after which frames are skipped until the
+        debt is paid off, so the average stays below the rate.
+
+        :param rate: the maximum average bytes per second
+        :type rate: float
+        """
+        self.rate = rate
+        self.tokens = rate
+        self.last = monotonic()
+
+    def allow(self):
+        """Whether a frame may be drawn now."""
+        now = monotonic()
+        self.tokens = min(self.rate,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        return self.tokens > 0
+
+    def spend(self, num_bytes):
+        self.tokens -= num_bytes
+
+
+class AdaptiveInterval:
+    def __init__(self, minimum, maximum, threshold=5., growth=1.5):
+        """Picks the sampling interval based on how fast readings change.
+
+        The interval drops to the minimum as soon as utilization or memory
+        usage of any GPU changes by more than the threshold between samples,
+        and grows towards the maximum while readings stay stable.
+
+        :param minimum: the shortest interval in seconds
+        :param maximum: the longest interval in seconds
+        :param threshold: change in percentage points that counts as fast
+        :param growth: factor the interval grows by per stable sample
+        :type minimum: float
+        :type maximum: float
+        :type threshold: float
+        :type growth: float
+        """
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.threshold = threshold
+        self.growth = growth
+        self.interval = minimum
+        self.previous = None
+
+    def update(self, readings):
+        """Updates the interval with the latest readings.
+
+        :param readings: the utilization and memory usage of each GPU, in
+            percent
+        :type readings: list
+        :returns: the interval until the next sample
+        :rtype: float
+        """
+        if self.previous is not None:
+            # NaNs never compare greater, so unknown readings are ignored
+            change = max([abs(a - b) for a, b in zip(readings, self.previous)
+                          if abs(a - b) > 0] or [0.])
+            if change > self.threshold:
+                self.interval = self.minimum
+            elif change < self.threshold / 2:
+                self.interval = min(self.maximum,
+                                    self.interval * self.growth)
+        self.previous = readings
+        return self.interval
+
+
+def resample(times, values, step, end, count):
+    """Resamples samples taken at irregular times into evenly spaced columns.
+
+    Each column shows the largest sample taken during it, so short spikes
+    stay visible, or else the last sample taken before it.
+
+    :param times: when each sample was taken, in ascending order
+    :param values: the samples
+    :param step: the seconds each column covers
+    :param end: when the last column ends
+    :param count: the number of columns
+    :type times: list
+    :type values: list
+    :type step: float
+    :type end: float
+    :type count: int
+    :rtype: list
+    """
+    columns = []
+    j = bisect_left(times, end - count * step)
+    last = values[j - 1] if j > 0 else 0
+    for k in range(count):
+        column_end = end - (count - 1 - k) * step
+        peak = None
+        while j < len(times) and times[j] < column_end:
+            if peak is None or values[j] > peak:
+                peak = values[j]
+            j += 1
+        if peak is None:
+            columns.append(last)
+        else:
+            columns.append(peak)
+            last = values[j - 1]
+    return columns
+
+
 def parse_argument():
     """Parses command line arguments."""
     parser = argparse.ArgumentParser(description='graphically show GPU usage')
 
     parser.add_argument('-i', '--interval', type=float,
                         help='update interval in seconds')
+    parser.add_argument('--adaptive', type=float, metavar='MAX',
+                        help='samples less often while readings are stable, '
+                             'up to every MAX seconds, and at the update '
+                             'interval again as soon as they change quickly')
+    parser.add_argument('-f', '--fields', type=lambda x: x.split(','),
+                        default=[],
+                        help='comma separated nvidia-smi query fields to '
+                             'sample in addition to utilization and memory. '
+                             'Available fields: ' + ', '.join(FIELDS))
+    parser.add_argument('-m', '--metric', default='utilization.gpu',
+                        help='the field to plot at start, press M to cycle '
+                             'through all sampled fields')
+    parser.add_argument('--serve', nargs='?', const=SERVER_ADDRESS,
+                        metavar='ADDRESS',
+                        help='instead of showing graphs, samples the GPUs '
+                             'for any number of gpu-graph clients. ADDRESS '
+                             'is either HOST:PORT or the path of a unix '
+                             'socket, by default ' + SERVER_ADDRESS)
+    parser.add_argument('--connect', nargs='*', metavar='ADDRESS',
+                        help='shows the samples of one or more gpu-graph '
+                             'servers instead of sampling the GPUs')
+    parser.add_argument('--heatmap', action='store_true',
+                        help='start with the heatmap, which shows one row per '
+                             'GPU. It is also used when the window is too '
+                             'small for the usual plots. Press H to toggle.')
+    parser.add_argument('-b', '--braille', action='store_true',
+                        help='plot with braille dots, which fits twice the '
+                             'history and four times the detail')
+    parser.add_argument('--max-bps', type=float, metavar='BYTES',
+                        help='limits the bytes written to the terminal per '
+                             'second by skipping frames, for slow '
+                             'connections')
+    parser.add_argument('--stats', action='store_true',
+                        help='shows frame times and bytes written per second')
 
     return parser.parse_args()
 
 
 class GpuGraph:
-    def __init__(self, stdscr, colors, interval=1):
+    def __init__(self, stdscr, colors, interval=1, fields=None,
+                 metric='utilization.gpu', samples=None, braille=False,
+                 max_bps=None, show_stats=False, heatmap=False,
+                 adaptive=None, output=None):
         """Creates a GpuGraph Instance, which visualizes gpu usage as graphs.
 
         Visualizes GPU usage as ASCII graphs within the terminal window using
@@ -76,25 +578,84 @@ class GpuGraph:
         :param stdscr: the current stdscr instance from curses
         :param colors: whether or not to use colors.
         :param interval: how often to update the screen in seconds
+        :param fields: nvidia-smi query fields to sample in addition to the
+            default fields
+        :param metric: the field to plot in the line chart
+        :param samples: where to read samples from instead of sampling the
+            GPUs of this machine
+        :param braille: whether to plot using braille characters
+        :param max_bps: maximum average bytes per second to write to the
+            terminal, or None for no limit
+        :param show_stats: whether to show frame times and bytes per second
+        :param heatmap: whether to start with the heatmap
+        :param adaptive: the longest interval to sample at while readings are
+            stable, or None to always sample at the update interval
+        :param output: what counts the bytes written to the terminal, needed
+            for max_bps and the bytes per second shown by show_stats
         :type colors: bool
         :type interval: int or float
+        :type fields: list or None
+        :type metric: str
+        :type samples: SampleBlock or None
+        :type braille: bool
+        :type max_bps: float or None
+        :type show_stats: bool
+        :type heatmap: bool
+        :type adaptive: float or None
+        :type output: CountedOutput or None
 
         :returns: a GpuGraph object
         :rtype: GpuGraph
         """
         self.stdscr = stdscr
         self.interval = interval
-        self.gpus = get_gpus()
-        self.num_gpus = len(self.gpus)
+
+        if samples is None:
+            fields = DEFAULT_FIELDS + (fields or []) + [metric]
+            samples = SampleBlock(fields, count_gpus())
+            samples.sample()
+        self.samples = samples
+        self.num_gpus = samples.num_gpus
         assert self.num_gpus > 0, "No GPUs found"
 
-        self.val_utilizations = []
-        self.mem_utilizations = [{'gpu_total': gpu['memory_total'],
-                                  'gpu_usage': gpu['memory_used']}
-                                 for gpu in self.gpus]
+        self.metrics = self.samples.plottable
+        assert metric in self.metrics, "{} can't be plotted".format(metric)
+        self.metric = metric
+        # One history per plottable field per GPU, so switching metrics
+        # doesn't start from an empty plot
+        self.history = {metric: [[0, 0] for _ in range(self.num_gpus)]
+                        for metric in self.metrics}
+        for frame in self.samples.backlog:
+            for metric in self.metrics:
+                for i in range(self.num_gpus):
+                    self.history[metric][i].append(
+                        self.samples.frame_value(frame, metric, i))
+        # When each sample was taken. Earlier samples are assumed to have
+        # been taken at the update interval.
+        now = monotonic()
+        length = len(self.history[self.metric][0])
+        self.times = [[now - (length - 1 - j) * interval
+                       for j in range(length)]
+                      for _ in range(self.num_gpus)]
+        self.ticks = 0
+
+        # Samples from a server are paced by the server
+        self.adaptive = None
+        if adaptive and not self.samples.paced:
+            self.adaptive = AdaptiveInterval(interval, adaptive)
+        self.sample_interval = interval
+        # When the next sample is due and when the current frame was drawn.
+        # Frames are drawn every update interval even if no sample is due,
+        # so the plots keep scrolling and keys are handled in time.
+        self.next_sample = now
+        self.frame_at = now
         self.windows = []
         self.sizes = None
         self.window_width = 0
+        # The heatmap is used when asked for or when the plots don't fit
+        self.prefer_heatmap = heatmap
+        self.heatmap = False
+        self.heatmap_rows = []
         self.calculate_sizes()
 
         self.redraw = True
@@ -102,14 +663,25 @@ class GpuGraph:
 
         self.colors = colors
 
+        self.braille = braille
+        self.budget = ByteBudget(max_bps) if max_bps else None
+        self.show_stats = show_stats
+        self.stats = FrameStats(output)
+        # What was last drawn in each part of each window, so only rows that
+        # changed are written again
+        self.drawn = {}
+
     def run(self):
         # Clear screen
         self.stdscr.clear()
         self.stdscr.nodelay(True)
         self.mainloop()
         while self.cont:
-            t = Timer(self.interval, self.mainloop)
-            t.run()
+            if self.samples.paced:
+                self.mainloop()
+            else:
+                t = Timer(self.interval, self.mainloop)
+                t.run()
 
     def mainloop(self):
         keys = self.read_keys()
@@ -118,9 +690,21 @@ class GpuGraph:
             self.cont = False
             return
 
+        if ord('m') in keys and len(self.metrics) > 1:
+            self.metric = self.metrics[(self.metrics.index(self.metric) + 1)
+                                       % len(self.metrics)]
+            self.redraw = True
+
+        if ord('h') in keys:
+            self.prefer_heatmap = not self.prefer_heatmap
+            keys.append(KEY_RESIZE)
+
         # Handle window resize
         if KEY_RESIZE in keys or self.sizes == -1:
             self.handle_window_resize()
+            if self.samples.paced:
+                # Keep up with the samples, which also waits for the next one
+                self.samples.sample()
             return
 
         if self.redraw:
@@ -129,17 +713,50 @@ class GpuGraph:
             self.redraw = False
 
         # Now run the plotting and stuff
-        self.gpus = get_gpus()
-        for i in range(self.num_gpus):
-            # Get utilizations
-            self.val_utilizations[i].append(self.gpus[i]['load'] * 100)
-            self.mem_utilizations[i]['gpu_usage'] = self.gpus[i]['memory_used']
+        now = monotonic()
+        self.frame_at = now
+        # Frames may come slightly early, which shouldn't delay the sample
+        # by a whole frame
+        if self.adaptive is None \
+                or now >= self.next_sample - self.interval / 2:
+            self.samples.sample()
+            self.ticks += 1
+            for i in range(self.num_gpus):
+                # Get the values of every plottable field
+                for metric in self.metrics:
+                    self.history[metric][i].append(
+                        self.samples.values[metric][i])
+                self.times[i].append(now)
+
+            if self.adaptive is not None:
+                used = self.samples.values['memory.used']
+                total = self.samples.values['memory.total']
+                self.sample_interval = self.adaptive.update(
+                    list(self.samples.values['utilization.gpu'])
+                    + [u / t * 100 if t > 0 else float('nan')
+                       for u, t in zip(used, total)])
+                self.next_sample = now + self.sample_interval
+
+        # Skip drawing if the terminal connection is over its budget. The
+        # samples are still kept, so the next frame catches up.
+        if self.budget is not None and not self.budget.allow():
+            return
 
+        self.stats.start()
+        if self.heatmap:
+            self.draw_heatmap()
+        for i in range(len(self.sizes)):
             # Actually draw the windows
             self.draw_utilization_plot(i)
             self.draw_memory_chart(i)
+            self.draw_throttle_reasons(i)
+        if self.show_stats:
+            self.draw_stats()
 
         doupdate()
+        self.stats.end()
+        if self.budget is not None:
+            self.budget.spend(self.stats.frame_bytes)
 
     def read_keys(self):
         """Reads all keys pressed between calls.
@@ -193,20 +810,33 @@ class GpuGraph:
             key_color = []
             strip_color = []
 
-        self.stdscr.addstr(h, 0, ' Q', *key_color)
-        self.stdscr.addstr(h, 2, ' Quit', *strip_color)
+        keys = [(' Q', ' Quit')]
+        if len(self.metrics) > 1 and not self.heatmap:
+            keys.append((' M', ' Metric'))
+        keys.append((' H', ' Heatmap'))
+        start = 0
+        for key, label in keys:
+            if start + len(key + label) > w - 10:
+                break
+            self.stdscr.addstr(h, start, key, *key_color)
+            self.stdscr.addstr(h, start + len(key), label, *strip_color)
+            start += len(key + label)
         self.stdscr.addstr(h, w - 10, 'gpu-graph', *strip_color)
-        self.stdscr.addstr(h, 7, ' ' * (w - 17), *strip_color)
+        self.stdscr.addstr(h, start, ' ' * (w - start - 10), *strip_color)
         self.stdscr.noutrefresh()
 
     def redraw_windows(self):
         """Redraws windows according to screen sizes."""
+        if self.heatmap:
+            h, w = self.stdscr.getmaxyx()
+            self.windows = [newwin(h - 1, w - 1, 0, 0)]
+            self.drawn = {}
+            return
         windows = []
-        val_utilizations = []
         for i, size in enumerate(self.sizes):
             win = newwin(size['nlines'], size['ncols'],
                          size['begin_y'], size['begin_x'])
-            name = self.gpus[i]['name']
+            name = self.samples.values['name'][i]
             if len(name) > size['ncols'] - 11:
                 name = name[:size['ncols'] - 12] + "…"
             win.clear()
@@ -214,13 +844,17 @@ class GpuGraph:
                 win.attrset(curses.color_pair(9))
             win.border()
             win.addstr(0, 2, "GPU {}: {}".format(i, name))
+            if self.metric != 'utilization.gpu':
+                label = " {} ({}) ".format(self.metric,
+                                           FIELDS[self.metric][1])
+                win.addstr(size['nlines'] - 1, 2,
+                           label[:max(0, size['ncols'] // 2 - 3)])
             if self.colors:
                 win.attrset(curses.color_pair(0))
             win.noutrefresh()
             windows.append(win)
-            val_utilizations.append([0, 0])
         self.windows = windows
-        self.val_utilizations = val_utilizations
+        self.drawn = {}
 
     def draw_utilization_plot(self, i: int):
         """Draws the GPU utilization plot.
@@ -232,18 +866,42 @@ class GpuGraph:
                                         2,
                                         2)
         h, w = window.getmaxyx()
-        if len(self.val_utilizations[i]) > w - 7:
-            self.val_utilizations[i].pop(0)
+        # Each braille character holds two samples
+        length = (w - 7) * (2 if self.braille else 1)
+        self.trim_history(i, length)
+
+        series = [0 if val != val else val
+                  for val in self.columns(self.metric, i, length)]
+        minimum, maximum = self.samples.plot_range(self.metric, i)
+        # Limits aren't always reported, and can be briefly exceeded
+        if maximum != maximum or maximum < max(series):
+            maximum = max(series)
+        if maximum <= minimum:
+            maximum = minimum + 1
+        if FIELDS[self.metric][1] == '%':
+            label_format = '{:>3.0f}% '
+        elif maximum >= 10000:
+            # Labels only have room for 4 digits
+            series = [val / 1000 for val in series]
+            minimum /= 1000
+            maximum /= 1000
+            label_format = '{:>3.0f}k '
+        else:
+            label_format = '{:>4.0f} '
 
-        res = self.plot_line_chart(self.val_utilizations[i],
-                                   height=h,
-                                   minimum=0,
-                                   maximum=100,
-                                   format='{:>3.0f}% ')
+        if self.braille:
+            plot = self.plot_braille_chart
+        else:
+            plot = self.plot_line_chart
+        res = plot(series,
+                   height=h,
+                   minimum=minimum,
+                   maximum=maximum,
+                   format=label_format)
 
         top_10 = floor(len(res) / 10)
 
-        for j, line in enumerate(res):
+        for j, line in self.changed_rows(('plot', i), res):
             if self.colors:
                 axis_color = [curses.color_pair(7)]
                 if j <= top_10:
@@ -262,6 +920,50 @@ class GpuGraph:
 
         window.noutrefresh()
 
+    def trim_history(self, i, count):
+        """Forgets the samples of a GPU that no longer fit in count columns.
+
+        :param i: the current gpu/window iterator value
+        :param count: the number of columns shown
+        """
+        times = self.times[i]
+        if self.adaptive is None:
+            cut = len(times) - count
+        else:
+            # Keep the last sample before the first column, which is shown
+            # until the next sample
+            cut = bisect_left(times,
+                              self.column_end() - count * self.interval) - 1
+        if cut > 0:
+            for metric in self.metrics:
+                del self.history[metric][i][:cut]
+            del times[:cut]
+
+    def columns(self, metric, i, count):
+        """Gets the values of a metric to show in up to count columns.
+
+        With adaptive sampling, samples are resampled so each column covers
+        the update interval. Otherwise each sample is a column.
+
+        :param metric: the field to get
+        :param i: the current gpu/window iterator value
+        :param count: the number of columns shown
+        :rtype: list
+        """
+        if self.adaptive is None:
+            return self.history[metric][i][-count:]
+        return resample(self.times[i], self.history[metric][i],
+                        self.interval, self.column_end(), count)
+
+    def column_end(self):
+        """When the column of the current frame ends.
+
+        Columns are aligned to multiples of the update interval so they stay
+        in place between frames. Columns after the latest sample of a GPU
+        repeat it.
+        """
+        return (floor(self.frame_at / self.interval) + 1) * self.interval
+
     def draw_memory_chart(self, i: int):
         """Draws a column chart visualization of memory usage.
 
@@ -273,16 +975,15 @@ class GpuGraph:
                                         self.sizes[i]['ncols'] - 7)
         h, w = window.getmaxyx()
 
-        # Clear out rows
-        for y_pos in range(h - 3, -1, -1):
-            window.addstr(y_pos, 0, ' ' * w)
-
-        gpu_usage = self.mem_utilizations[i]['gpu_usage']
-        gpu_total = self.mem_utilizations[i]['gpu_total']
+        gpu_usage = self.samples.values['memory.used'][i]
+        gpu_total = self.samples.values['memory.total'][i]
 
         # Calculate number of blocks to use. Each row can either be 1 or 2
         # blocks.
-        blocks = floor(gpu_usage / gpu_total * (h + h - 2))
+        if gpu_usage == gpu_usage and gpu_total > 0:
+            blocks = floor(gpu_usage / gpu_total * (h + h - 2))
+        else:
+            blocks = 0
 
         top_10 = floor((h - 1) / 10)
         # If this requires a half block, the value will be odd
@@ -299,8 +1000,8 @@ class GpuGraph:
         else:
             value_color = []
 
-        # Then draw the memory used value
-        window.addstr(h - 2, 0, value, *value_color)
+        # Start with empty rows and the memory used value at the bottom
+        rows = [(' ' * w, [])] * (h - 2) + [(value, value_color)]
 
         # Now set the default bar colors.
         if self.colors:
@@ -308,24 +1009,93 @@ class GpuGraph:
         else:
             bar_color = []
 
-        # Now draw in the rows. Start from the bottom.
-        for i in range(h - 3, -1, -1):
+        # Now fill in the rows. Start from the bottom.
+        for y_pos in range(h - 3, -1, -1):
             # Check to see if we've reached top 10% yet.
-            if self.colors and i <= top_10:
+            if self.colors and y_pos <= top_10:
                 bar_color = [curses.color_pair(10)]
 
             if gpu_usage == 0:
-                window.addstr(i, 0, '_' * w, *bar_color)
+                rows[y_pos] = ('_' * w, bar_color)
                 break
             if full_rows == 0 and not half_row:
                 break
             if full_rows != 0:
-                window.addstr(i, 0, '█' * w, *bar_color)
+                rows[y_pos] = ('█' * w, bar_color)
                 full_rows -= 1
             elif half_row:
-                window.addstr(i, 0, '▄' * w, *bar_color)
+                rows[y_pos] = ('▄' * w, bar_color)
                 half_row = False
 
+        for y_pos, (line, color) in self.changed_rows(('memory', i), rows):
+            window.addstr(y_pos, 0, line, *color)
+
+        window.noutrefresh()
+
+    def changed_rows(self, key, rows):
+        """Finds the rows that differ from the last time they were drawn.
+
+        Rows can be strings or (string, color) tuples.
+
+        :param key: identifies which part of which window the rows are for
+        :param rows: the rows to draw
+        :type key: tuple
+        :type rows: list
+        :returns: (index, row) of each row that has to be drawn again
+        :rtype: list
+        """
+        previous = self.drawn.get(key, [])
+        self.drawn[key] = rows
+        changed = []
+        for j, row in enumerate(rows):
+            old = previous[j] if j < len(previous) else None
+            if row != old:
+                changed.append((j, row))
+        return changed
+
+    def draw_stats(self):
+        """Draws frame time and bytes written per second in the bottom bar."""
+        h = self.stdscr.getmaxyx()[0] - 1
+        text = ' {:5.1f} ms {:7.1f} kB/s '.format(
+            self.stats.frame_time * 1000, self.stats.bytes_per_second / 1000)
+        if self.adaptive is not None:
+            text = ' {:5.1f} s'.format(self.sample_interval) + text
+        x = self.window_width - 10 - len(text)
+        if x < 16:
+            return
+        strip_color = [curses.color_pair(21)] if self.colors else []
+        self.stdscr.addstr(h, x, text, *strip_color)
+        self.stdscr.noutrefresh()
+
+    def draw_throttle_reasons(self, i: int):
+        """Draws why the clocks are throttled on the bottom border, if known.
+
+        :param i: the current gpu/window iterator value
+        """
+        field = 'clocks_throttle_reasons.active'
+        if field not in self.samples.values:
+            return
+        value = self.samples.values[field][i]
+        reasons = []
+        if value == value:
+            # Being idle isn't a slowdown worth showing
+            reasons = [name for bit, name in THROTTLE_REASONS[1:]
+                       if int(value) & bit]
+
+        window = self.windows[i]
+        y = self.sizes[i]['nlines'] - 1
+        width = self.sizes[i]['ncols'] // 2 - 2
+        x = self.sizes[i]['ncols'] - 1 - width
+        if self.colors:
+            window.attrset(curses.color_pair(9))
+        window.hline(y, x, curses.ACS_HLINE, width)
+        if reasons:
+            text = ' {} '.format(','.join(reasons))[:width]
+            if self.colors:
+                window.attrset(curses.color_pair(10))
+            window.addstr(y, x + width - len(text), text)
+        if self.colors:
+            window.attrset(curses.color_pair(0))
         window.noutrefresh()
 
     def calculate_sizes(self):
@@ -390,8 +1160,9 @@ class GpuGraph:
         width = floor(w / columns) - 1
         height = floor(h / rows) - 1
 
-        if width < min_width or height < min_height:
-            self.sizes = -1
+        self.heatmap = False
+        if width < min_width or height < min_height or self.prefer_heatmap:
+            self.calculate_heatmap_rows()
             return
 
         for i in range(self.num_gpus):
@@ -411,6 +1182,172 @@ class GpuGraph:
 
         self.sizes = sizes
 
+    def calculate_heatmap_rows(self):
+        """Lays out the heatmap, with a row per GPU grouped by host.
+
+        Sets self.sizes to -1 if even the heatmap doesn't fit.
+        """
+        h, w = self.stdscr.getmaxyx()
+        rows = []
+        first = 0
+        for i, host in enumerate(self.samples.hosts):
+            if i == 0 or host != self.samples.hosts[i - 1]:
+                rows.append(host)
+                first = i
+            # GPUs are numbered as on their own host
+            rows.append((i, i - first))
+
+        if len(rows) > h - 1 or w < 30:
+            self.sizes = -1
+            return
+        self.heatmap = True
+        self.heatmap_rows = rows
+        self.window_width = w
+        self.sizes = []
+
+    def draw_heatmap(self):
+        """Draws the heatmap of utilization over time.
+
+        Each row is a GPU with its index and memory usage, followed by one
+        cell per sample colored by utilization, newest on the right. After a
+        full draw, each tick only shifts the cells of each row to the left and
+        draws the newest column, which terminals can do with a few bytes.
+        """
+        window = self.windows[0]
+        h, w = window.getmaxyx()
+        # Index, memory usage, and a space take up 10 columns. The last
+        # column is left empty so the cursor never has to leave the window.
+        x = 10
+        width = w - x - 1
+        # Which column the newest sample is in, to know how far to shift
+        if self.adaptive is None:
+            column = self.ticks
+        else:
+            column = floor(self.frame_at / self.interval)
+        shift = column - self.drawn.get('heatmap', column - width)
+        full = shift >= width
+        self.drawn['heatmap'] = column
+
+        for y, row in enumerate(self.heatmap_rows):
+            if isinstance(row, str):
+                if full:
+                    window.addstr(y, 0, row[:w - 1], curses.A_BOLD)
+                continue
+
+            i, index = row
+            self.trim_history(i, width)
+            series = self.columns('utilization.gpu', i, width)
+
+            used = self.samples.values['memory.used'][i]
+            total = self.samples.values['memory.total'][i]
+            memory = used / total * 100 if total > 0 else float('nan')
+            label = '{:>3} {:>4.0f}% '.format(index, memory)
+            label_color = []
+            if self.colors:
+                label_color = [curses.color_pair(10 if memory > 90 else 9)]
+            window.addstr(y, 0, label, *label_color)
+
+            if full:
+                cells = [self.heatmap_cell(val) for val in series]
+                window.addstr(y, x, ' ' * (width - len(cells)))
+                for j, (char, color) in enumerate(cells):
+                    window.addstr(y, x + width - len(cells) + j, char,
+                                  *color)
+            else:
+                # Shift the row left by deleting its first cells, then draw
+                # the newest cells at the end. The newest cell is drawn again
+                # even without a shift, since a later sample in the same
+                # column may be larger.
+                window.move(y, x)
+                for _ in range(shift):
+                    window.delch()
+                new = max(shift, 1)
+                cells = [self.heatmap_cell(val) for val in series[-new:]]
+                for j, (char, color) in enumerate(cells):
+                    window.addstr(y, x + width - new + j, char, *color)
+
+        window.noutrefresh()
+
+    def heatmap_cell(self, load):
+        """Gets the character and color of a heatmap cell.
+
+        :param load: the utilization in percent
+        :type load: float
+        :rtype: tuple
+        """
+        if load != load:
+            return '?', []
+        level = min(len(HEATMAP_LEVELS) - 1,
+                    int(ceil(load / 100 * (len(HEATMAP_LEVELS) - 1))))
+        char, color = HEATMAP_LEVELS[level]
+        return char, [curses.color_pair(color + 1)] if self.colors else []
+
+    @staticmethod
+    def plot_braille_chart(series, height, minimum=None, maximum=None,
+                           format=None):
+        """Returns a chart drawn with braille dots.
+
+        Each character holds 2 samples side by side and 4 dots vertically, so
+        the chart shows twice the samples of plot_line_chart at four times the
+        vertical resolution in the same space. Takes the same arguments as
+        plot_line_chart.
+
+        :returns: A list of lines that when printed resemble a line chart.
+        :rtype: list
+        """
+        series_min = min(series)
+        series_max = max(series)
+        if minimum is not None:
+            assert minimum <= series_min
+        else:
+            minimum = series_min
+        if maximum is not None:
+            assert maximum >= series_max
+        else:
+            maximum = series_max
+
+        if format is None:
+            format = '{:>%d.0f} ' % len(str(maximum))
+
+        interval = abs(float(maximum) - float(minimum)) or 1.
+        ratio = interval / (height - 1)
+        dots = height * 4
+
+        def get_dot(val):
+            """Gets the dot row of val, counting up from the bottom.
+
+            :rtype: int
+            """
+            return int(round((float(val) - minimum) / interval * (dots - 1)))
+
+        # Initialize the label list and the series plot
+        first_row = height - 1 - get_dot(series[0]) // 4
+        y_axis_labels = []
+        for y_pos in range(height):
+            row = format.format(maximum - (ratio * y_pos))
+            if y_pos == height - 1 or y_pos == first_row:
+                row += '┼'
+            else:
+                row += '┤'
+            y_axis_labels.append(row)
+
+        cells = [[0] * ((len(series) + 1) // 2) for _ in range(height)]
+
+        # Set the dots of each sample, with a vertical line joining it to the
+        # previous sample
+        prev_dot = None
+        for x, val in enumerate(series):
+            dot = get_dot(val)
+            start = dot if prev_dot is None else prev_dot
+            for y in range(min(start, dot), max(start, dot) + 1):
+                cells[height - 1 - y // 4][x // 2] |= \
+                    BRAILLE_DOTS[x % 2][3 - y % 4]
+            prev_dot = dot
+
+        return [label + ''.join(chr(0x2800 + cell) if cell else ' '
+                                for cell in row)
+                for label, row in zip(y_axis_labels, cells)]
+
     @staticmethod
     def plot_line_chart(series, height, minimum=None, maximum=None,
                         format=None):
@@ -504,9 +1441,41 @@ class GpuGraph:
 
 def gpu_graph():
     args = parse_argument()
+    from .gpu_broadcast import GpuServer, RemoteSamples, MultiSamples
+    if args.serve:
+        server = GpuServer(args.serve, DEFAULT_FIELDS + args.fields,
+                           args.interval or 1)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            exit(0)
+        return
+
+    # Bytes written are only counted when they're shown or limited
+    output = None
+    if args.stats or args.max_bps:
+        output = CountedOutput()
+        # Before connecting, since MultiSamples starts threads
+        output.start()
+
+    samples = None
+    if args.connect is not None:
+        try:
+            if len(args.connect) > 1:
+                samples = MultiSamples(args.connect)
+            else:
+                samples = RemoteSamples((args.connect or [SERVER_ADDRESS])[0])
+        except BaseException:
+            if output is not None:
+                output.stop()
+            raise
+        args.interval = samples.interval
+
     try:
         # Initialize curses
         stdscr = curses.initscr()
+        if output is not None:
+            signal.signal(signal.SIGWINCH, output.handle_resize)
         curses.noecho()
         curses.cbreak()
         stdscr.keypad(1)
@@ -526,9 +1495,16 @@ def gpu_graph():
             colors = False
 
         if args.interval:
-            graph = GpuGraph(stdscr, colors, args.interval)
+            graph = GpuGraph(stdscr, colors, args.interval, args.fields,
+                             args.metric, samples, args.braille,
+                             args.max_bps, args.stats, args.heatmap,
+                             args.adaptive, output)
         else:
-            graph = GpuGraph(stdscr, colors)
+            graph = GpuGraph(stdscr, colors, fields=args.fields,
+                             metric=args.metric, samples=samples,
+                             braille=args.braille, max_bps=args.max_bps,
+                             show_stats=args.stats, heatmap=args.heatmap,
+                             adaptive=args.adaptive, output=output)
         graph.run()
     except KeyboardInterrupt:
         exit(0)
@@ -542,6 +1518,8 @@ def gpu_graph():
         curses.echo()
         curses.nocbreak()
         curses.endwin()
+        if output is not None:
+            output.stop()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+"""GPU Idle
+
+Watches GPUs allocated to Slurm jobs and docker containers and reports the
+holders whose GPUs have been idle for too long.
+
+Each GPU keeps a rolling window of its utilization. A holder turns idle once
+the rolling average of all of its GPUs falls below the idle threshold and only
+turns active again once one of them rises above the higher active threshold,
+so that short bursts of work don't reset the idle timer. Events are written as
+one JSON object per line or passed to a hook command.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+
+Created on:
+    October 18, 2026
+"""
+from argparse import ArgumentParser
+from collections import deque
+from datetime import datetime
+from math import ceil
+from subprocess import run, CalledProcessError
+from time import sleep, time
+import json
+import sys
+
+from .gpu_graph import get_gpus
+from .sgpu import get_jobs, get_gpu_indices
+from .container_inspect import (get_docker_ids, get_system_gpus,
+                                inspect_containers, parse_gpu_ids)
+
+
+def parse_args():
+    p = ArgumentParser(description='reports gpus allocated to slurm jobs or '
+                                   'docker containers that sit idle')
+
+    p.add_argument('-i', '--interval', type=float, default=10.,
+                   help='sampling interval in seconds')
+    p.add_argument('-w', '--window', type=float, default=300.,
+                   help='length of the rolling utilization window in seconds')
+    p.add_argument('-l', '--limit', type=float, default=3600.,
+                   help='seconds a holder must be idle before it is reported')
+    p.add_argument('--idle-threshold', type=float, default=5.,
+                   help='utilization in percent below which a gpu is idle')
+    p.add_argument('--active-threshold', type=float, default=20.,
+                   help='utilization in percent above which an idle gpu is '
+                        'active again')
+    p.add_argument('--holder-interval', type=float, default=60.,
+                   help='how often to refresh jobs and containers in seconds')
+    p.add_argument('--hook', metavar='CMD',
+                   help='shell command to run for each event, which receives '
+                        'the event as json on stdin, instead of printing it')
+    p.add_argument('--no-jobs', action='store_true',
+                   help="don't watch slurm jobs")
+    p.add_argument('--no-containers', action='store_true',
+                   help="don't watch docker containers")
+
+    return p.parse_args()
+
+
+def sample_loads():
+    """Samples the utilization of each GPU in percent, in index order."""
+    return [gpu['load'] * 100 for gpu in get_gpus()]
+
+
+def get_holders(jobs=True, containers=True):
+    """Gets every Slurm job and docker container that holds GPUs.
+
+    :param bool jobs: Whether to include Slurm jobs.
+    :param bool containers: Whether to include docker containers.
+    :return: A list of dictionaries containing 'kind', 'id', 'user', and
+        'gpus', the indices of the GPUs held.
+    :rtype: list
+    """
+    holders = []
+    if jobs:
+        try:
+            job_dicts = get_jobs(detail=True)
+        except FileNotFoundError:
+            job_dicts = []
+        for job in job_dicts:
+            try:
+                gpus = get_gpu_indices(job)
+                if job.get('JobState') == 'RUNNING' and gpus:
+                    holders.append({'kind': 'job',
+                                    'id': job['JobId'],
+                                    'user': job['UserId'].split('(')[0],
+                                    'gpus': gpus})
+            except (KeyError, ValueError):
+                # A job we can't parse shouldn't hide the others
+                continue
+    if containers:
+        try:
+            info = inspect_containers(get_docker_ids(), get_system_gpus())
+        except (FileNotFoundError, CalledProcessError):
+            info = []
+        for container in info:
+            gpus = parse_gpu_ids(container.get('GpusUsed', ''))
+            if not gpus:
+                continue
+            holders.append({'kind': 'container',
+                            'id': container.get('Name', ''),
+                            'user': container.get('User', ''),
+                            'gpus': gpus})
+    return holders
+
+
+class IdleDetector:
+    def __init__(self, sampler, holders, interval=10., window=300.,
+                 limit=3600., idle_threshold=5., active_threshold=20.):
+        """Creates an IdleDetector, which finds idle holders of GPUs.
+
+        :param sampler: Function returning the utilization of each GPU in
+            percent, in index order.
+        :param holders: Function returning the current holders of GPUs, as
+            returned by get_holders.
+        :param interval: Seconds between calls to step.
+        :param window: Length of the rolling window of each GPU in seconds.
+        :param limit: Seconds a holder must be idle before it is reported.
+        :param idle_threshold: Utilization below which a GPU is idle.
+        :param active_threshold: Utilization above which an idle GPU is
+            active again.
+        :type sampler: callable
+        :type holders: callable
+        :type interval: float
+        :type window: float
+        :type limit: float
+        :type idle_threshold: float
+        :type active_threshold: float
+        """
+        self.sampler = sampler
+        self.holders = holders
+        self.window_length = max(1, ceil(window / interval))
+        self.limit = limit
+        self.idle_threshold = idle_threshold
+        self.active_threshold = active_threshold
+
+        # Memory stays bounded: one fixed length window per GPU and one state
+        # per current holder.
+        self.windows = []
+        self.states = {}
+        self.current_holders = []
+
+    def refresh_holders(self, now=None):
+        """Reads the current holders, forgetting the ones that are gone.
+
+        :param now: The current time in seconds, defaults to time().
+        :type now: float or None
+        :return: Events for flagged holders that released their GPUs.
+        :rtype: list
+        """
+        if now is None:
+            now = time()
+        self.current_holders = self.holders()
+        keys = {(h['kind'], h['id']) for h in self.current_holders}
+        events = []
+        for key in list(self.states):
+            if key not in keys:
+                state = self.states[key]
+                if state['flagged']:
+                    events.append(self.event('released', state['holder'],
+                                             now))
+                del self.states[key]
+        return events
+
+    def step(self, now=None):
+        """Takes one sample and updates the state of each holder.
+
+        :param now: The current time in seconds, defaults to time().
+        :type now: float or None
+        :return: The events emitted in this step.
+        :rtype: list
+        """
+        if now is None:
+            now = time()
+        loads = self.sampler()
+        while len(self.windows) < len(loads):
+            self.windows.append(deque(maxlen=self.window_length))
+        for window, load in zip(self.windows, loads):
+            window.append(load)
+
+        events = []
+        for holder in self.current_holders:
+            averages = [sum(self.windows[gpu]) / len(self.windows[gpu])
+                        for gpu in holder['gpus']
+                        if gpu < len(self.windows) and self.windows[gpu]]
+            if not averages:
+                continue
+            load = max(averages)
+
+            key = (holder['kind'], holder['id'])
+            state = self.states.get(key)
+            if state is None:
+                state = {'holder': holder, 'idle_since': None,
+                         'flagged': False, 'load': load}
+                self.states[key] = state
+            state['holder'] = holder
+            state['load'] = load
+
+            if state['idle_since'] is None:
+                if load < self.idle_threshold:
+                    state['idle_since'] = now
+            elif load > self.active_threshold:
+                if state['flagged']:
+                    events.append(self.event('active', holder, now))
+                state['idle_since'] = None
+                state['flagged'] = False
+
+            if state['idle_since'] is not None and not state['flagged'] \
+                    and now - state['idle_since'] >= self.limit:
+                state['flagged'] = True
+                events.append(self.event('idle', holder, now))
+        return events
+
+    def event(self, name, holder, now):
+        """Creates an event for the given holder."""
+        state = self.states.get((holder['kind'], holder['id']), {})
+        idle_since = state.get('idle_since')
+        return {'time': datetime.fromtimestamp(now).isoformat(),
+                'event': name,
+                'kind': holder['kind'],
+                'id': holder['id'],
+                'user': holder['user'],
+                'gpus': holder['gpus'],
+                'load': round(state.get('load', 0.), 1),
+                'idle_seconds': (round(now - idle_since)
+                                 if idle_since is not None else 0)}
+
+
+def emit(event, hook=None):
+    """Prints the event as a line of json or passes it to the hook command."""
+    line = json.dumps(event)
+    if hook is None:
+        print(line, flush=True)
+    else:
+        run(hook, shell=True, input=line + '\n', universal_newlines=True)
+
+
+def gpu_idle():
+    args = parse_args()
+    detector = IdleDetector(
+        sample_loads,
+        lambda: get_holders(not args.no_jobs, not args.no_containers),
+        args.interval, args.window, args.limit, args.idle_threshold,
+        args.active_threshold)
+
+    last_refresh = None
+    try:
+        while True:
+            start = time()
+            events = []
+            try:
+                if last_refresh is None \
+                        or start - last_refresh >= args.holder_interval:
+                    events += detector.refresh_holders(start)
+                    last_refresh = start
+                events += detector.step(start)
+            except Exception as e:
+                # Keep watching through a failed sample, the next one may work
+                print('gpu-idle: {}: {}'.format(type(e).__name__, e),
+                      file=sys.stderr, flush=True)
+            for event in events:
+                emit(event, args.hook)
+            sleep(max(0., args.interval - (time() - start)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    gpu_idle()
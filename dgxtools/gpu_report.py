@@ -0,0 +1,462 @@
+#!/usr/bin/python3
+"""GPU Report
+
+Joins recorded GPU utilization samples with the GPUs allocated to each Slurm
+job to show how efficiently each job and each user uses their GPUs.
+
+GPU samples are recorded using nvidia-smi itself, e.g.
+
+    nvidia-smi --query-gpu=timestamp,index,utilization.gpu,memory.used,\
+memory.total --format=csv,noheader,nounits -l 1 > dgx.csv
+
+Job allocations are recorded by regularly running `gpu-report --snapshot`,
+e.g. from cron, which appends the GPUs held by each running job to a CSV file.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+
+Created on:
+    October 18, 2026
+"""
+from argparse import ArgumentParser
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import accumulate, groupby
+import csv
+import os
+
+from .sgpu import HOSTS, get_jobs, get_gpu_indices
+from .topology import parse_cpu_list, format_cpu_list
+
+
+JOB_FIELDS = ['host', 'job_id', 'user', 'gpus', 'start', 'seen']
+
+# Samples are aggregated per minute, so job windows are rounded out to whole
+# minutes
+BUCKET = 60
+
+
+def parse_args():
+    p = ArgumentParser(description='shows how well each slurm job and user '
+                                   'utilizes their allocated gpus')
+
+    p.add_argument('-s', '--samples', nargs='+', metavar='[HOST=]FILE',
+                   help='csv files recorded with nvidia-smi. The host is '
+                        'taken from the file name unless given as HOST=FILE.')
+    p.add_argument('-j', '--jobs', metavar='FILE',
+                   help='csv file of job allocations recorded with '
+                        '--snapshot.')
+    p.add_argument('--snapshot', metavar='FILE',
+                   help='instead of reporting, appends the gpus allocated '
+                        'to currently running jobs to FILE.')
+    p.add_argument('-a', '--all', action='store_true',
+                   help='snapshots all dgx servers instead of only this one.')
+
+    return p.parse_args()
+
+
+def short_host(host):
+    """Strips the domain of a host name, so 'dgx.example.com' matches 'dgx'."""
+    return host.split('.')[0]
+
+
+def parse_minute(minute, days):
+    """Parses the minute of an nvidia-smi timestamp, e.g. '2026/10/18 13:05'.
+
+    :param str minute: The first 16 characters of a timestamp.
+    :param dict days: Cache of the dates parsed so far.
+    :return: Seconds since the epoch.
+    :rtype: float
+    """
+    date = minute[:10]
+    day = days.get(date)
+    if day is None:
+        day = datetime.strptime(date, '%Y/%m/%d').timestamp()
+        days[date] = day
+    return day + int(minute[11:13]) * 3600 + int(minute[14:16]) * 60
+
+
+def parse_floats(values):
+    """Converts a column of strings to floats, with 0 for missing values."""
+    try:
+        return array('d', map(float, values))
+    except ValueError:
+        return array('d', (safe_float(value) for value in values))
+
+
+def safe_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return 0.
+
+
+class GpuSeries:
+    """Per minute aggregates of one GPU with prefix sums for fast windows.
+
+    :param times: Start of each minute in seconds since the epoch, sorted.
+    :param counts: Number of samples in each minute.
+    :param loads: Sum of the GPU utilization in each minute in percent.
+    :param memory: Peak memory used in each minute in MiB.
+    """
+    def __init__(self, times, counts, loads, memory):
+        self.times = times
+        self.memory = memory
+        self.count_sums = array('d', [0.])
+        self.count_sums.extend(accumulate(counts))
+        self.load_sums = array('d', [0.])
+        self.load_sums.extend(accumulate(loads))
+
+    def window(self, start, end):
+        """Aggregates the minutes overlapping the time between start and end.
+
+        :return: Number of samples, sum of utilization, and peak memory used.
+        :rtype: tuple
+        """
+        lo = bisect_right(self.times, start - BUCKET)
+        hi = bisect_right(self.times, end)
+        if hi <= lo:
+            return 0, 0., 0.
+        return (int(self.count_sums[hi] - self.count_sums[lo]),
+                self.load_sums[hi] - self.load_sums[lo],
+                max(self.memory[lo:hi]))
+
+
+def add_sample(buckets, gpu, minute, count, load, memory):
+    """Adds samples of one GPU in one minute to the aggregates."""
+    bucket = buckets.setdefault(gpu, {}).get(minute)
+    if bucket is None:
+        buckets[gpu][minute] = [count, load, memory]
+    else:
+        bucket[0] += count
+        bucket[1] += load
+        bucket[2] = max(bucket[2], memory)
+
+
+def aggregate_ticks(fields, ncols, n, buckets, days):
+    """Aggregates whole ticks, where each tick is one line per GPU in order.
+
+    Each column of each GPU is a stride of the fields, so it is converted
+    all at once, and each minute of it is summed up as a slice.
+
+    :param list fields: The fields of the lines, in order.
+    :param int ncols: The number of fields per line.
+    :param int n: The number of GPUs, i.e. lines per tick.
+    :param dict buckets: Aggregates to add to, by GPU index and minute.
+    :param dict days: Cache of the dates parsed so far.
+    """
+    stride = ncols * n
+    minutes = []
+    start = 0
+    for minute, ticks in groupby(tick[:16] for tick in fields[::stride]):
+        end = start + sum(1 for _ in ticks)
+        minutes.append((parse_minute(minute, days), start, end))
+        start = end
+
+    for i in range(n):
+        gpu = int(fields[i * ncols + 1])
+        loads = parse_floats(fields[i * ncols + 2::stride])
+        memory = parse_floats(fields[i * ncols + 3::stride])
+        for minute, start, end in minutes:
+            add_sample(buckets, gpu, minute, end - start,
+                       sum(loads[start:end]), max(memory[start:end]))
+
+
+def aggregate_lines(lines, buckets, days):
+    """Aggregates lines one by one, skipping malformed lines."""
+    for line in lines:
+        row = line.split(', ')
+        if len(row) < 4 or not row[1].isdigit() or len(row[0]) < 16:
+            continue
+        try:
+            minute = parse_minute(row[0][:16], days)
+        except ValueError:
+            continue
+        add_sample(buckets, int(row[1]), minute, 1, safe_float(row[2]),
+                   safe_float(row[3]))
+
+
+def load_sample_file(path, chunk_size=1 << 20):
+    """Loads one GPU sample file into one GpuSeries per GPU index.
+
+    The file is read in chunks of about chunk_size bytes, and each chunk is
+    reduced to per minute aggregates of each GPU before the next is read, so
+    memory stays bounded by the chunk size and the number of minutes.
+
+    nvidia-smi writes one line per GPU in index order at every tick. Chunks
+    in that shape are split at once and converted column by column. Only
+    chunks that aren't are parsed line by line.
+
+    :param str path: File path, optionally prefixed by 'HOST='.
+    :param int chunk_size: Roughly how many bytes to read at once.
+    :return: The host and a dictionary mapping GPU indices to GpuSeries.
+    :rtype: tuple
+    """
+    if '=' in path:
+        host, path = path.split('=', 1)
+    else:
+        host = os.path.splitext(os.path.basename(path))[0]
+
+    days = {}
+    buckets = {}
+    leftover = ''
+    with open(path) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                aggregate_lines(leftover.splitlines(), buckets, days)
+                break
+            # Only whole lines are parsed, the rest waits for the next chunk
+            text = leftover + chunk
+            cut = text.rfind('\n') + 1
+            text, leftover = text[:cut], text[cut:]
+            if not text:
+                continue
+
+            num_lines = text.count('\n')
+            ncols = text[:text.find('\n')].count(', ') + 1
+            fields = text.replace('\n', ', ').split(', ')[:-1]
+            indices = fields[1::ncols]
+            try:
+                n = indices.index(indices[0], 1)
+            except ValueError:
+                n = len(indices)
+            ticks = len(indices) // n
+            if ncols < 4 or len(fields) != ncols * num_lines \
+                    or indices[:n * ticks] != indices[:n] * ticks \
+                    or not all(map(str.isdigit, indices[:n])):
+                # The last tick may be cut off, and the next chunk should
+                # start with a whole tick, so its lines wait for the rest
+                lines = text.splitlines()
+                last = lines[-1][:19]
+                end = len(lines)
+                while end > 0 and lines[end - 1][:19] == last:
+                    end -= 1
+                if end > 0:
+                    leftover = ''.join(line + '\n' for line in lines[end:]) \
+                        + leftover
+                    lines = lines[:end]
+                aggregate_lines(lines, buckets, days)
+                continue
+
+            # A tick cut off at the end of the chunk waits for the rest
+            rest = fields[ncols * n * ticks:]
+            leftover = ''.join(', '.join(rest[i:i + ncols]) + '\n'
+                               for i in range(0, len(rest), ncols)) \
+                + leftover
+            aggregate_ticks(fields[:ncols * n * ticks], ncols, n, buckets,
+                            days)
+
+    series = {}
+    for gpu, minutes in buckets.items():
+        times = sorted(minutes)
+        series[gpu] = GpuSeries(array('d', times),
+                                array('d', (minutes[t][0] for t in times)),
+                                array('d', (minutes[t][1] for t in times)),
+                                array('d', (minutes[t][2] for t in times)))
+    return short_host(host), series
+
+
+def load_samples(paths):
+    """Loads GPU sample files into one GpuSeries per host and GPU index.
+
+    Each file is loaded by its own process, so the files of several hosts are
+    loaded at the same time.
+
+    :param list paths: File paths, optionally prefixed by 'HOST='.
+    :return: Dictionary mapping (host, gpu index) to GpuSeries.
+    :rtype: dict
+    """
+    if len(paths) > 1:
+        with ProcessPoolExecutor() as pool:
+            loaded = list(pool.map(load_sample_file, paths))
+    else:
+        loaded = [load_sample_file(path) for path in paths]
+
+    series = {}
+    for host, gpus in loaded:
+        for gpu, gpu_series in gpus.items():
+            series[(host, gpu)] = gpu_series
+    return series
+
+
+def load_jobs(path):
+    """Loads job allocations recorded by snapshot_jobs.
+
+    Each job is seen in multiple snapshots. A job is considered to have ended
+    at the last snapshot it was seen in.
+
+    :param str path: The job allocation csv file.
+    :return: A list of dictionaries containing 'host', 'job_id', 'user',
+        'gpus', 'start', and 'end'.
+    :rtype: list
+    """
+    jobs = {}
+    with open(path) as f:
+        for row in csv.DictReader(f):
+            host = short_host(row['host'])
+            key = (host, row['job_id'])
+            seen = float(row['seen'])
+            if key in jobs:
+                jobs[key]['end'] = max(jobs[key]['end'], seen)
+                continue
+            jobs[key] = {
+                'host': host,
+                'job_id': row['job_id'],
+                'user': row['user'],
+                'gpus': parse_cpu_list(row['gpus']),
+                'start': datetime.strptime(
+                    row['start'], '%Y-%m-%dT%H:%M:%S').timestamp(),
+                'end': seen
+            }
+    return list(jobs.values())
+
+
+def snapshot_jobs(path, hosts):
+    """Appends the GPUs allocated to each running job to the given file.
+
+    :param str path: The job allocation csv file.
+    :param list hosts: Hosts to snapshot. None stands for this machine.
+    """
+    now = datetime.now().timestamp()
+    write_header = not os.path.exists(path)
+    with open(path, 'a') as f:
+        writer = csv.DictWriter(f, JOB_FIELDS)
+        if write_header:
+            writer.writeheader()
+        for host in hosts:
+            for job in get_jobs(host, detail=True):
+                gpus = get_gpu_indices(job)
+                if job.get('JobState') != 'RUNNING' or not gpus:
+                    continue
+                writer.writerow({'host': host or os.uname()[1],
+                                 'job_id': job['JobId'],
+                                 'user': job['UserId'].split('(')[0],
+                                 'gpus': format_cpu_list(gpus),
+                                 'start': job['StartTime'],
+                                 'seen': now})
+
+
+def job_efficiency(jobs, series):
+    """Computes the efficiency of each job.
+
+    :param list jobs: Jobs from load_jobs.
+    :param dict series: GPU samples from load_samples.
+    :return: A list of dictionaries containing the job's 'job_id', 'user',
+        'host', 'gpus', and its 'hours', average 'load', peak 'memory',
+        allocated 'gpu_hours', and 'wasted' GPU hours.
+    :rtype: list
+    """
+    report = []
+    for job in jobs:
+        count = 0
+        load_sum = 0.
+        peak = 0.
+        for gpu in job['gpus']:
+            gpu_series = series.get((job['host'], gpu))
+            if gpu_series is None:
+                continue
+            n, total, memory = gpu_series.window(job['start'], job['end'])
+            count += n
+            load_sum += total
+            peak = max(peak, memory)
+        if count == 0:
+            continue
+
+        load = load_sum / count
+        hours = (job['end'] - job['start']) / 3600
+        gpu_hours = hours * len(job['gpus'])
+        report.append({'job_id': job['job_id'],
+                       'user': job['user'],
+                       'host': job['host'],
+                       'gpus': len(job['gpus']),
+                       'hours': hours,
+                       'load': load,
+                       'memory': peak,
+                       'gpu_hours': gpu_hours,
+                       'wasted': gpu_hours * (1 - load / 100)})
+    return report
+
+
+def user_efficiency(job_report):
+    """Sums up the efficiency of each user's jobs.
+
+    :param list job_report: The output of job_efficiency.
+    :return: A list of dictionaries containing 'user', 'jobs', 'gpu_hours',
+        average 'load' weighted by GPU hours, peak 'memory', and 'wasted'.
+    :rtype: list
+    """
+    users = {}
+    for job in job_report:
+        user = users.setdefault(job['user'], {'user': job['user'], 'jobs': 0,
+                                              'gpu_hours': 0., 'load': 0.,
+                                              'memory': 0., 'wasted': 0.})
+        user['jobs'] += 1
+        user['gpu_hours'] += job['gpu_hours']
+        user['load'] += job['load'] * job['gpu_hours']
+        user['memory'] = max(user['memory'], job['memory'])
+        user['wasted'] += job['wasted']
+    for user in users.values():
+        if user['gpu_hours'] > 0:
+            user['load'] /= user['gpu_hours']
+    return sorted(users.values(), key=lambda x: -x['wasted'])
+
+
+def output(job_report, user_report):
+    """Outputs the job and user reports as tables."""
+    header = "{:<8.8} {:<8.8} {:<12.12} {:>4.4} {:>8.8} {:>8.8} {:>8.8} " \
+             "{:>8.8} {:>8.8}"
+    print('\033[47;30m'
+          + header.format('JobId', 'UserId', 'Host', 'GPUs', 'Hours',
+                          'Avg Util', 'Mem Peak', 'GPU-h', 'Wasted')
+          + '\033[49;39m')
+    for job in sorted(job_report, key=lambda x: -x['wasted']):
+        print(header.format(job['job_id'], job['user'], job['host'],
+                            str(job['gpus']),
+                            '{:.1f}'.format(job['hours']),
+                            '{:.0f}%'.format(job['load']),
+                            '{:.0f}M'.format(job['memory']),
+                            '{:.1f}'.format(job['gpu_hours']),
+                            '{:.1f}'.format(job['wasted'])))
+    print('')
+
+    header = "{:<8.8} {:>4.4} {:>8.8} {:>8.8} {:>8.8} {:>8.8}"
+    print('\033[47;30m'
+          + header.format('UserId', 'Jobs', 'GPU-h', 'Avg Util', 'Mem Peak',
+                          'Wasted')
+          + '\033[49;39m')
+    for user in user_report:
+        print(header.format(user['user'], str(user['jobs']),
+                            '{:.1f}'.format(user['gpu_hours']),
+                            '{:.0f}%'.format(user['load']),
+                            '{:.0f}M'.format(user['memory']),
+                            '{:.1f}'.format(user['wasted'])))
+    print('')
+
+
+def gpu_report():
+    args = parse_args()
+    if args.snapshot:
+        snapshot_jobs(args.snapshot, HOSTS if args.all else [None])
+        return
+    if not args.samples or not args.jobs:
+        print('Both --samples and --jobs are required for a report.')
+        return
+
+    jobs = load_jobs(args.jobs)
+    job_report = job_efficiency(jobs, load_samples(args.samples))
+    output(job_report, user_efficiency(job_report))
+
+    reported = {(job['host'], job['job_id']) for job in job_report}
+    missing = [job for job in jobs
+               if (job['host'], job['job_id']) not in reported]
+    if missing:
+        hosts = sorted({job['host'] for job in missing})
+        print('{} job(s) matched no samples and are not in the report. '
+              'Hosts: {}'.format(len(missing), ', '.join(hosts)))
+
+
+if __name__ == '__main__':
+    gpu_report()
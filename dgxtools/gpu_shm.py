@@ -0,0 +1,302 @@
+#!/usr/bin/python3
+"""GPU Shared Memory
+
+Publishes the latest state of each GPU in shared memory so that every tool on
+a machine can read it without running nvidia-smi itself.
+
+The publisher writes a fixed layout segment in /dev/shm: a header followed by
+one entry per GPU. Writes are guarded by a sequence lock. The publisher makes
+the sequence number odd while it writes and even again once it's done, and a
+reader retries if the number was odd or changed while it copied the segment.
+Readers never take a lock, so they can't hold up the publisher, and a read is
+a memory copy from a mapping kept open between reads.
+
+Tools use the snapshot when a publisher is running and fall back to running
+nvidia-smi when there is none or it has stopped updating.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+
+Created on:
+    October 18, 2026
+"""
+from argparse import ArgumentParser
+from subprocess import Popen, PIPE
+from time import sleep, time
+import fcntl
+import mmap
+import os
+import signal
+import struct
+
+
+SHM_PATH = '/dev/shm/dgxtools-gpus'
+
+MAGIC = b'DGXG'
+VERSION = 1
+
+# Magic, version, sequence number, time of the snapshot, seconds between
+# snapshots, and number of GPUs
+HEADER = struct.Struct('<4sIQddI4x')
+SEQ = struct.Struct('<Q')
+SEQ_OFFSET = 8
+COUNT = struct.Struct('<I')
+COUNT_OFFSET = 32
+
+# Index, utilization in percent, memory used and total in MiB, UUID, and name
+ENTRY = struct.Struct('<I4xddd48s64s')
+
+MAX_GPUS = 64
+SIZE = HEADER.size + MAX_GPUS * ENTRY.size
+
+# How often a reader retries while the publisher is writing
+READ_RETRIES = 100
+
+# The nvidia-smi fields a snapshot holds, and their keys in each GPU read
+SNAPSHOT_KEYS = {'index': 'id',
+                 'uuid': 'uuid',
+                 'utilization.gpu': 'load',
+                 'memory.used': 'memory_used',
+                 'memory.total': 'memory_total',
+                 'name': 'name'}
+
+
+def parse_args():
+    p = ArgumentParser(description='publishes the state of each gpu in shared '
+                                   'memory for other dgxtools to read')
+
+    p.add_argument('-i', '--interval', type=float, default=1.,
+                   help='sampling interval in seconds')
+    p.add_argument('-p', '--path', default=SHM_PATH,
+                   help='where to publish, by default ' + SHM_PATH)
+
+    return p.parse_args()
+
+
+def parse_float(value):
+    """Parses a float, or NaN if nvidia-smi doesn't know the value."""
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+
+def sample_gpus():
+    """Samples the fields of a snapshot from nvidia-smi.
+
+    :return: A list of dictionaries containing 'id', 'uuid', 'load',
+        'memory_used', 'memory_total', and 'name', which is empty if
+        nvidia-smi failed.
+    :rtype: list
+    """
+    try:
+        p = Popen(['nvidia-smi',
+                   '--query-gpu=' + ','.join(SNAPSHOT_KEYS),
+                   '--format=csv,noheader,nounits'],
+                  stdout=PIPE)
+        stdout, stderror = p.communicate()
+    except FileNotFoundError:
+        return []
+    if p.returncode != 0:
+        return []
+    gpus = []
+    for line in stdout.decode('UTF-8').split(os.linesep)[:-1]:
+        vals = line.split(', ', len(SNAPSHOT_KEYS) - 1)
+        if len(vals) < len(SNAPSHOT_KEYS):
+            continue
+        gpus.append({'id': int(vals[0]),
+                     'uuid': vals[1],
+                     'load': parse_float(vals[2]) / 100,
+                     'memory_used': parse_float(vals[3]),
+                     'memory_total': parse_float(vals[4]),
+                     'name': vals[5]})
+    return gpus
+
+
+class SnapshotWriter:
+    def __init__(self, path=SHM_PATH):
+        """Creates a SnapshotWriter, which publishes GPU snapshots.
+
+        An existing segment is reused rather than replaced, so readers that
+        have it mapped see the new snapshots. Only one writer can publish to
+        a path at a time.
+
+        :param path: Where to publish.
+        :type path: str
+        """
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self.fd)
+            raise RuntimeError('Another publisher is using ' + path)
+        os.fchmod(self.fd, 0o644)
+        os.ftruncate(self.fd, SIZE)
+        self.map = mmap.mmap(self.fd, SIZE)
+        self.seq = SEQ.unpack_from(self.map, SEQ_OFFSET)[0]
+        if self.seq & 1:
+            # A previous publisher stopped in the middle of a write
+            self.seq += 1
+
+    def write(self, gpus, interval):
+        """Publishes a snapshot.
+
+        :param gpus: GPUs as returned by sample_gpus.
+        :param interval: Seconds until the next snapshot, which readers use
+            to tell whether the publisher is still running.
+        :type gpus: list
+        :type interval: float
+        """
+        gpus = gpus[:MAX_GPUS]
+        SEQ.pack_into(self.map, SEQ_OFFSET, self.seq + 1)
+        for i, gpu in enumerate(gpus):
+            ENTRY.pack_into(self.map, HEADER.size + i * ENTRY.size,
+                            gpu['id'], gpu['load'] * 100,
+                            gpu['memory_used'], gpu['memory_total'],
+                            gpu['uuid'].encode('UTF-8'),
+                            gpu['name'].encode('UTF-8'))
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.seq + 1, time(),
+                         interval, len(gpus))
+        self.seq += 2
+        SEQ.pack_into(self.map, SEQ_OFFSET, self.seq)
+
+    def close(self):
+        """Stops publishing and removes the segment."""
+        self.map.close()
+        os.unlink(self.path)
+        os.close(self.fd)
+
+
+class SnapshotReader:
+    def __init__(self, path=SHM_PATH):
+        """Creates a SnapshotReader, which reads published GPU snapshots.
+
+        The segment is mapped on the first read and kept mapped, so later
+        reads don't make any system calls.
+
+        :param path: Where the snapshots are published.
+        :type path: str
+        """
+        self.path = path
+        self.map = None
+
+    def open(self):
+        """Maps the segment.
+
+        :return: Whether a segment written by a compatible publisher exists.
+        :rtype: bool
+        """
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            self.map = mmap.mmap(fd, SIZE, prot=mmap.PROT_READ)
+        except (OSError, ValueError):
+            return False
+        finally:
+            os.close(fd)
+        magic, version = struct.unpack_from('<4sI', self.map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            return False
+        return True
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+    def read(self, max_age=None):
+        """Reads the latest snapshot.
+
+        :param max_age: Seconds after which a snapshot is too old to use. By
+            default, a snapshot is too old once the publisher has missed two
+            snapshots.
+        :type max_age: float or None
+        :return: A list of dictionaries containing 'id', 'uuid', 'load',
+            'memory_used', 'memory_total', and 'name', or None if there is no
+            recent snapshot with any GPUs.
+        :rtype: list or None
+        """
+        if self.map is None and not self.open():
+            return None
+
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(self.map, SEQ_OFFSET)[0]
+            if seq & 1:
+                continue
+            num_gpus = min(COUNT.unpack_from(self.map, COUNT_OFFSET)[0],
+                           MAX_GPUS)
+            data = self.map[:HEADER.size + num_gpus * ENTRY.size]
+            if SEQ.unpack_from(self.map, SEQ_OFFSET)[0] == seq:
+                break
+        else:
+            return None
+
+        _, _, _, timestamp, interval, num_gpus = HEADER.unpack_from(data)
+        if num_gpus == 0:
+            # Callers fall back to nvidia-smi rather than seeing no GPUs
+            return None
+        if max_age is None:
+            max_age = interval * 3
+        if time() - timestamp > max_age:
+            # The publisher may have been restarted with a new segment
+            self.close()
+            return None
+
+        gpus = []
+        for i in range(num_gpus):
+            index, load, used, total, uuid, name = ENTRY.unpack_from(
+                data, HEADER.size + i * ENTRY.size)
+            gpus.append({'id': index,
+                         'uuid': uuid.rstrip(b'\0').decode('UTF-8'),
+                         'load': load / 100,
+                         'memory_used': used,
+                         'memory_total': total,
+                         'name': name.rstrip(b'\0').decode('UTF-8')})
+        return gpus
+
+
+_reader = SnapshotReader()
+
+
+def read_snapshot(max_age=None):
+    """Reads the latest snapshot published on this machine.
+
+    :param max_age: Seconds after which a snapshot is too old to use.
+    :type max_age: float or None
+    :return: The GPUs as returned by SnapshotReader.read, or None if no
+        publisher is running.
+    :rtype: list or None
+    """
+    return _reader.read(max_age)
+
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def gpu_publish():
+    args = parse_args()
+    writer = SnapshotWriter(args.path)
+    # Services are stopped with SIGTERM, which should also remove the segment
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while True:
+            start = time()
+            gpus = sample_gpus()
+            # A failed sample isn't published, so once the last snapshot is
+            # too old, readers run nvidia-smi themselves
+            if gpus:
+                writer.write(gpus, args.interval)
+            sleep(max(0., args.interval - (time() - start)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+
+
+if __name__ == '__main__':
+    gpu_publish()
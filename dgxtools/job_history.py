@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+"""Job History
+
+Keeps a local SQLite cache of finished Slurm jobs read from sacct. Each sync
+only asks sacct for the jobs that ended since the previous sync, so queries
+over weeks of history don't have to go through slurmdbd.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+
+Created on:
+    October 18, 2026
+"""
+from subprocess import Popen, PIPE, CalledProcessError
+from datetime import datetime
+from time import time
+import os
+import re
+import sqlite3
+
+from .topology import CACHE_DIR
+
+
+HISTORY_PATH = os.path.join(CACHE_DIR, 'history.db')
+
+SACCT_FIELDS = ['JobID', 'JobName', 'User', 'State', 'Start', 'End',
+                'ElapsedRaw', 'AllocCPUS', 'AllocTRES']
+
+# States of jobs that have ended
+END_STATES = 'CA,CD,DL,F,NF,OOM,PR,TO'
+
+# Jobs still being written to the accounting database when a sync runs may
+# show up late, so each sync looks this many seconds further back.
+SYNC_OVERLAP = 300
+
+MEMORY_UNITS = {'K': 1. / 1024, 'M': 1., 'G': 1024., 'T': 1024. ** 2}
+
+
+def parse_time(value):
+    """Parses a sacct time into seconds since the epoch, or None."""
+    try:
+        return int(datetime.strptime(value,
+                                     '%Y-%m-%dT%H:%M:%S').timestamp())
+    except ValueError:
+        return None
+
+
+def parse_tres(tres):
+    """Parses a TRES string, e.g. 'cpu=8,gres/gpu=2,mem=64G,node=1'.
+
+    :param str tres: The AllocTRES value from sacct.
+    :return: The number of GPUs and the memory in MiB.
+    :rtype: tuple
+    """
+    gpus = 0
+    mem_mb = 0
+    for item in tres.split(','):
+        if '=' not in item:
+            continue
+        key, value = item.split('=', 1)
+        # Typed GPUs, e.g. gres/gpu:v100=2, are also counted in gres/gpu
+        if key == 'gres/gpu':
+            gpus = int(value)
+        elif key == 'mem':
+            match = re.match(r'([\d.]+)([KMGT]?)', value)
+            if match is not None:
+                mem_mb = int(float(match.group(1))
+                             * MEMORY_UNITS.get(match.group(2) or 'M'))
+    return gpus, mem_mb
+
+
+def parse_sacct(lines):
+    """Parses the parsable output of sacct into job rows.
+
+    :param list lines: Lines output by sacct with -n -P and SACCT_FIELDS.
+    :return: A list of tuples (job_id, name, user, state, start, end,
+        elapsed, cpus, gpus, mem_mb).
+    :rtype: list
+    """
+    jobs = []
+    for line in lines:
+        vals = line.split('|')
+        if len(vals) < len(SACCT_FIELDS):
+            continue
+        job_id, name, user, state, start, end, elapsed, cpus, tres = \
+            vals[:len(SACCT_FIELDS)]
+        gpus, mem_mb = parse_tres(tres)
+        jobs.append((job_id, name, user, state.split(' ')[0],
+                     parse_time(start), parse_time(end),
+                     int(elapsed) if elapsed.isdigit() else 0,
+                     int(cpus) if cpus.isdigit() else 0,
+                     gpus, mem_mb))
+    return jobs
+
+
+def run_sacct(start, ssh=None):
+    """Reads the jobs that ended since start from sacct.
+
+    Args:
+        start (int): Seconds since the epoch.
+        ssh (str or None): If ssh is not None, then runs the sacct command
+             from that address through ssh instead.
+
+    Returns:
+        list: The output lines of sacct.
+
+    Raises:
+        FileNotFoundError: If sacct, or ssh, can't be found.
+        CalledProcessError: If sacct fails, e.g. when slurmdbd can't be
+            reached, so a failed read isn't mistaken for no jobs.
+    """
+    command = []
+    if ssh is not None:
+        command += ['ssh', '-o', 'StrictHostKeyChecking=no', ssh]
+    command += ['sacct', '-a', '-X', '-n', '-P',
+                '--state=' + END_STATES,
+                '-S', datetime.fromtimestamp(start).strftime(
+                    '%Y-%m-%dT%H:%M:%S'),
+                '-E', 'now',
+                '--format=' + ','.join(SACCT_FIELDS)]
+    p = Popen(command, stdout=PIPE, stderr=PIPE)
+    stdout, stderror = p.communicate()
+    if p.returncode != 0:
+        raise CalledProcessError(p.returncode, command, stdout, stderror)
+    return stdout.decode('UTF-8').splitlines()
+
+
+class JobHistory:
+    def __init__(self, path=HISTORY_PATH, sacct=run_sacct):
+        """Creates a JobHistory, a cache of finished jobs.
+
+        :param path: Where the SQLite database is stored.
+        :param sacct: Function taking the start time and host and returning
+            the lines output by sacct.
+        :type path: str
+        :type sacct: callable
+        """
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.sacct = sacct
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                host TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                name TEXT,
+                user TEXT,
+                state TEXT,
+                start INTEGER,
+                end INTEGER,
+                elapsed INTEGER,
+                cpus INTEGER,
+                gpus INTEGER,
+                mem_mb INTEGER,
+                PRIMARY KEY (host, job_id)
+            );
+            CREATE INDEX IF NOT EXISTS jobs_end ON jobs (end);
+            CREATE INDEX IF NOT EXISTS jobs_user_end ON jobs (user, end);
+            CREATE TABLE IF NOT EXISTS syncs (
+                host TEXT PRIMARY KEY,
+                covered INTEGER NOT NULL,
+                synced INTEGER NOT NULL
+            );
+        ''')
+
+    def sync(self, host, since):
+        """Fetches the jobs that ended since the last sync of a host.
+
+        Jobs older than what the cache already covers are only fetched if
+        since asks for them. If sacct fails, the error is raised and the
+        cache is left as it was, so the next sync fetches the same range.
+
+        :param host: The host to run sacct on, None for this machine.
+        :param since: Seconds since the epoch the cache should cover.
+        :type host: str or None
+        :type since: int
+        :return: The number of jobs fetched.
+        :rtype: int
+        """
+        key = host or 'localhost'
+        now = int(time())
+        row = self.db.execute('SELECT covered, synced FROM syncs '
+                              'WHERE host = ?', (key,)).fetchone()
+        if row is not None and row[0] <= since:
+            start = row[1] - SYNC_OVERLAP
+            covered = row[0]
+        else:
+            start = since
+            covered = since
+
+        jobs = parse_sacct(self.sacct(start, host))
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO jobs VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(key,) + job for job in jobs])
+            self.db.execute('INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)',
+                            (key, covered, now))
+        return len(jobs)
+
+    def usage_per_user(self, since, hosts=None):
+        """Sums up the resources used by each user since a given time.
+
+        Only the part of each job that ran after since is counted.
+
+        :param since: Seconds since the epoch.
+        :param hosts: Only count jobs from these hosts. None stands for this
+            machine in the list. Counts all hosts if not given.
+        :type since: int
+        :type hosts: list or None
+        :return: A list of tuples (user, jobs, GPU hours, CPU hours) sorted by
+            GPU hours.
+        :rtype: list
+        """
+        query = '''
+            SELECT user, COUNT(*),
+                   SUM(gpus * (end - MAX(start, :since))) / 3600.,
+                   SUM(cpus * (end - MAX(start, :since))) / 3600.
+            FROM jobs
+            WHERE end >= :since AND start IS NOT NULL
+        '''
+        params = {'since': since}
+        if hosts is not None:
+            names = [host or 'localhost' for host in hosts]
+            query += ' AND host IN ({})'.format(
+                ', '.join(':host{}'.format(i) for i in range(len(names))))
+            params.update(('host{}'.format(i), name)
+                          for i, name in enumerate(names))
+        query += ' GROUP BY user ORDER BY 3 DESC'
+        return self.db.execute(query, params).fetchall()
@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+"""Node Overview
+
+Shows what is running on each GPU of this machine: its utilization and the
+Slurm jobs and docker containers that hold it.
+
+nvidia-smi, scontrol, and docker are all queried at the same time, so the
+overview takes as long as the slowest of them instead of all of them combined.
+A tool that doesn't answer within the timeout is left out of the overview.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+
+Created on:
+    October 18, 2026
+"""
+from argparse import ArgumentParser
+from asyncio import create_subprocess_exec, gather, run, wait_for
+from asyncio.subprocess import PIPE, DEVNULL
+import asyncio
+import json
+
+from .gpu_graph import safe_float_cast
+from .sgpu import parse_jobs, get_gpu_indices
+from .container_inspect import (get_user, get_visible_devices,
+                                resolve_devices)
+from .gpu_shm import read_snapshot
+
+
+def parse_args():
+    p = ArgumentParser(description='shows the utilization, slurm jobs and '
+                                   'docker containers of each gpu')
+
+    p.add_argument('-t', '--timeout', type=float, default=5.,
+                   help='seconds to wait for each tool before leaving it out')
+
+    return p.parse_args()
+
+
+async def run_command(*command):
+    """Runs a command without blocking the event loop.
+
+    :return: The output of the command.
+    :rtype: str
+    """
+    p = await create_subprocess_exec(*command, stdout=PIPE, stderr=DEVNULL)
+    try:
+        stdout, stderror = await p.communicate()
+    except asyncio.CancelledError:
+        # Don't leave the process behind if we've stopped waiting for it
+        p.kill()
+        raise
+    if p.returncode != 0:
+        raise RuntimeError('exited with code {}'.format(p.returncode))
+    return stdout.decode('UTF-8')
+
+
+async def collect_gpus():
+    """Collects the state of each GPU.
+
+    :return: A list of dictionaries containing 'id', 'uuid', 'load',
+        'memory_used', 'memory_total', and 'name'.
+    :rtype: list
+    """
+    snapshot = read_snapshot()
+    if snapshot is not None:
+        return snapshot
+    stdout = await run_command(
+        'nvidia-smi',
+        '--query-gpu=index,uuid,utilization.gpu,memory.used,memory.total,name',
+        '--format=csv,noheader,nounits')
+    gpus = []
+    for line in stdout.splitlines():
+        vals = line.split(', ')
+        if len(vals) < 6:
+            continue
+        gpus.append({'id': int(vals[0]),
+                     'uuid': vals[1],
+                     'load': safe_float_cast(vals[2]) / 100,
+                     'memory_used': safe_float_cast(vals[3]),
+                     'memory_total': safe_float_cast(vals[4]),
+                     'name': vals[5]})
+    return gpus
+
+
+async def collect_jobs():
+    """Collects the running Slurm jobs holding GPUs.
+
+    :return: A list of dictionaries containing 'holder', 'user', and
+        'devices', the indices of the GPUs held as strings.
+    :rtype: list
+    """
+    stdout = await run_command('scontrol', 'show', 'job', '-d')
+    holders = []
+    for job in parse_jobs(stdout.splitlines()):
+        gpus = get_gpu_indices(job)
+        if job.get('JobState') == 'RUNNING' and gpus:
+            holders.append({'holder': 'job {} ({})'.format(job['JobId'],
+                                                           job['JobName']),
+                            'user': job['UserId'].split('(')[0],
+                            'devices': [str(gpu) for gpu in gpus]})
+    return holders
+
+
+async def collect_containers():
+    """Collects the running docker containers holding GPUs.
+
+    All containers are inspected using a single docker inspect call.
+
+    :return: A list of dictionaries containing 'holder', 'user', and
+        'devices', the UUIDs or indices of the GPUs held.
+    :rtype: list
+    """
+    container_ids = (await run_command('docker', 'ps', '-q')).split()
+    if not container_ids:
+        return []
+    inspections = json.loads(await run_command('docker', 'inspect',
+                                               *container_ids))
+    holders = []
+    for inspection in inspections:
+        devices = [device for device in
+                   get_visible_devices(inspection['Config']['Env'])
+                   if device and device != 'none']
+        if devices:
+            holders.append({'holder': 'container ' + inspection['Name'][1:],
+                            'user': get_user(inspection['Mounts']),
+                            'devices': devices})
+    return holders
+
+
+async def collect_all(timeout):
+    """Runs every collector concurrently, each with its own timeout.
+
+    :param float timeout: Seconds to wait for each collector.
+    :return: The GPUs, the holders, and a list of errors of the collectors
+        that failed.
+    :rtype: tuple
+    """
+    collectors = [('nvidia-smi', collect_gpus()),
+                  ('scontrol', collect_jobs()),
+                  ('docker', collect_containers())]
+    results = await gather(*(wait_for(coro, timeout)
+                             for _, coro in collectors),
+                           return_exceptions=True)
+
+    errors = []
+    for (name, _), result in zip(collectors, results):
+        if isinstance(result, asyncio.TimeoutError):
+            errors.append('{}: timed out after {}s'.format(name, timeout))
+        elif isinstance(result, FileNotFoundError):
+            errors.append('{}: not available'.format(name))
+        elif isinstance(result, Exception):
+            errors.append('{}: {}'.format(name, result))
+
+    gpus, jobs, containers = [[] if isinstance(result, Exception) else result
+                              for result in results]
+    return gpus, jobs + containers, errors
+
+
+def merge(gpus, holders):
+    """Merges GPUs and their holders into one row per GPU index.
+
+    :param list gpus: GPUs from collect_gpus.
+    :param list holders: Holders from collect_jobs and collect_containers.
+    :return: A list of dictionaries containing 'id', 'name', 'load',
+        'memory_used', 'memory_total', 'holders', and 'users', sorted by
+        GPU index.
+    :rtype: list
+    """
+    rows = {}
+    for gpu in gpus:
+        rows[gpu['id']] = dict(gpu, holders=[], users=[])
+
+    for holder in holders:
+        held = resolve_devices(holder['devices'], gpus)
+        # Without nvidia-smi, indices are still known
+        held += [int(device) for device in holder['devices']
+                 if device.isdigit() and int(device) not in held]
+        for gpu in held:
+            if gpu not in rows:
+                rows[gpu] = {'id': gpu, 'name': '-', 'load': None,
+                             'memory_used': None, 'memory_total': None,
+                             'holders': [], 'users': []}
+            rows[gpu]['holders'].append(holder['holder'])
+            if holder['user'] not in rows[gpu]['users']:
+                rows[gpu]['users'].append(holder['user'])
+    return [rows[gpu] for gpu in sorted(rows)]
+
+
+def output(rows, errors):
+    """Outputs the overview nicely in a table."""
+    holders = [6] + [len(', '.join(row['holders'])) for row in rows]
+    names = [4] + [len(row['name']) for row in rows]
+    header = "{:>3} {:<" + str(max(names)) + "} {:>5} {:>13} {:<" \
+             + str(max(holders)) + "} {}"
+    print('\033[47;30m'
+          + header.format('GPU', 'Name', 'Util', 'Memory', 'Holder', 'User')
+          + '\033[49;39m')
+    for row in rows:
+        if row['load'] is None:
+            load = '-'
+            memory = '-'
+        else:
+            load = '{:.0f}%'.format(row['load'] * 100)
+            memory = '{:.0f}/{:.0f}'.format(row['memory_used'],
+                                            row['memory_total'])
+        print(header.format(row['id'], row['name'], load, memory,
+                            ', '.join(row['holders']) or '-',
+                            ', '.join(row['users']) or '-'))
+    print('')
+
+    for error in errors:
+        print(error)
+    if errors:
+        print('')
+
+
+def node_overview():
+    args = parse_args()
+    gpus, holders, errors = run(collect_all(args.timeout))
+    output(merge(gpus, holders), errors)
+
+
+if __name__ == '__main__':
+    node_overview()
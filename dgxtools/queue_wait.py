@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+"""Queue Wait
+
+Estimates when pending Slurm jobs will start. Each running job is assumed to
+run until its time limit, and pending jobs are started in priority order as
+soon as a node has enough free GPUs, CPUs, and memory for them.
+
+The simulation only looks at the moments resources are released, kept in a
+heap, so it takes O(J log J) for J jobs instead of stepping through time.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+
+Created on:
+    October 18, 2026
+"""
+from heapq import heappush, heappop
+import re
+
+from .job_history import parse_tres, MEMORY_UNITS
+
+
+# Pending jobs waiting for these reasons can't start when resources free up
+BLOCKED_REASONS = ('Dependency', 'DependencyNeverSatisfied', 'JobHeldUser',
+                   'JobHeldAdmin', 'BeginTime')
+
+# Nodes in these states don't take new jobs
+DOWN_STATES = ('DOWN', 'DRAIN', 'FAIL', 'MAINT')
+
+
+def parse_duration(duration):
+    """Parses a Slurm duration, e.g. '1-02:03:04', '03:04', into seconds.
+
+    :param str duration: A duration as shown by scontrol.
+    :return: The number of seconds, or None if the duration is unlimited or
+        unknown.
+    :rtype: int or None
+    """
+    match = re.match(r'^(?:(\d+)-)?(\d+)(?::(\d+))?(?::(\d+))?$', duration)
+    if match is None:
+        return None
+    days, first, second, third = match.groups()
+    if third is not None:
+        seconds = int(first) * 3600 + int(second) * 60 + int(third)
+    elif second is not None:
+        # Days without seconds mean days-hours:minutes
+        seconds = (int(first) * 3600 + int(second) * 60 if days
+                   else int(first) * 60 + int(second))
+    else:
+        seconds = int(first) * 3600 if days else int(first) * 60
+    return seconds + int(days or 0) * 86400
+
+
+def parse_memory(memory):
+    """Parses a memory size, e.g. '64G', into MiB."""
+    match = re.match(r'([\d.]+)([KMGT]?)', memory)
+    if match is None:
+        return 0
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2) or 'M'])
+
+
+def job_resources(job):
+    """Gets the GPUs, CPUs, and memory per node a job holds or requests.
+
+    :param dict job: The job as returned by parse_jobs.
+    :return: A tuple (GPUs, CPUs, memory in MiB).
+    :rtype: tuple
+    """
+    # TRES is what a running job holds, ReqTRES what a pending job asks for
+    gpus, mem_mb = parse_tres(job.get('TRES') or job.get('ReqTRES', ''))
+    if gpus == 0:
+        # Older versions only show the requested GRES, e.g. gpu:v100:2
+        for key in ('TresPerNode', 'TRES_PER_NODE', 'Gres'):
+            match = re.search(r'gpu(?::[^:,(]+)?:(\d+)', job.get(key, ''))
+            if match is not None:
+                gpus = int(match.group(1))
+                break
+    if 'MinMemoryNode' in job:
+        mem_mb = parse_memory(job['MinMemoryNode'])
+    cpus = job.get('NumCPUs', '1').split('-')[0]
+    return gpus, int(cpus) if cpus.isdigit() else 1, mem_mb
+
+
+def node_capacities(nodes):
+    """Gets the resources of each node that can take jobs.
+
+    :param list nodes: Nodes as returned by parse_jobs on the output of
+        `scontrol show node`.
+    :return: A dictionary of node names to lists [GPUs, CPUs, memory in MiB].
+    :rtype: dict
+    """
+    capacities = {}
+    for node in nodes:
+        if 'NodeName' not in node:
+            continue
+        if any(state in node.get('State', '') for state in DOWN_STATES):
+            continue
+        gpus, mem_mb = parse_tres(node.get('CfgTRES', ''))
+        if 'RealMemory' in node:
+            mem_mb = int(node['RealMemory'])
+        cpus = node.get('CPUTot', '0')
+        capacities[node['NodeName']] = [gpus,
+                                        int(cpus) if cpus.isdigit() else 0,
+                                        mem_mb]
+    return capacities
+
+
+def split_jobs(jobs):
+    """Splits jobs into running jobs and pending jobs for simulate.
+
+    :param list jobs: Jobs as returned by parse_jobs.
+    :return: A list of running jobs as tuples (seconds left, node, GPUs, CPUs,
+        memory) and a list of pending jobs as tuples (job, GPUs, CPUs, memory,
+        time limit), sorted by priority. Pending jobs waiting on something
+        other than resources are left out.
+    :rtype: tuple
+    """
+    running = []
+    pending = []
+    for job in jobs:
+        state = job.get('JobState')
+        if state == 'RUNNING':
+            limit = parse_duration(job.get('TimeLimit', ''))
+            elapsed = parse_duration(job.get('RunTime', '')) or 0
+            left = None if limit is None else max(0, limit - elapsed)
+            running.append((left, job.get('NodeList'))
+                           + job_resources(job))
+        elif state == 'PENDING' \
+                and job.get('Reason') not in BLOCKED_REASONS:
+            pending.append((job,) + job_resources(job)
+                           + (parse_duration(job.get('TimeLimit', '')),))
+    # Higher priority first, then the older job
+    pending.sort(key=lambda x: (-int(x[0].get('Priority', '0')),
+                                x[0].get('SubmitTime', ''),
+                                x[0].get('JobId', '')))
+    return running, pending
+
+
+def simulate(capacities, running, requests):
+    """Simulates the queue to estimate when each request starts.
+
+    Requests are started strictly in the given order, each as soon as a node
+    has room for it, on the node that has the fewest free GPUs left over. A
+    request never starts before the ones ahead of it, i.e. there is no
+    backfilling.
+
+    :param dict capacities: The output of node_capacities.
+    :param list running: Running jobs as tuples (seconds left or None, node,
+        GPUs, CPUs, memory), as returned by split_jobs.
+    :param list requests: Tuples (GPUs, CPUs, memory, time limit or None) in
+        priority order.
+    :return: One tuple (seconds until start, node) per request, or (None,
+        None) if it never fits.
+    :rtype: list
+    """
+    free = {node: list(capacity) for node, capacity in capacities.items()}
+    releases = []
+    for count, (left, node, gpus, cpus, mem_mb) in enumerate(running):
+        if node not in free:
+            continue
+        free[node][0] -= gpus
+        free[node][1] -= cpus
+        free[node][2] -= mem_mb
+        if left is not None:
+            # The count keeps ties from comparing node names
+            heappush(releases, (left, count, node, gpus, cpus, mem_mb))
+    count = len(running)
+
+    now = 0
+    starts = []
+    for gpus, cpus, mem_mb, limit in requests:
+        if not any(gpus <= capacity[0] and cpus <= capacity[1]
+                   and mem_mb <= capacity[2]
+                   for capacity in capacities.values()):
+            # Would never fit, so Slurm won't let it block the queue
+            starts.append((None, None))
+            continue
+
+        while True:
+            fits = [node for node, f in free.items()
+                    if gpus <= f[0] and cpus <= f[1] and mem_mb <= f[2]]
+            if fits or not releases:
+                break
+            # Jump to the next time resources are released
+            left, _, node, r_gpus, r_cpus, r_mem = heappop(releases)
+            now = max(now, left)
+            free[node][0] += r_gpus
+            free[node][1] += r_cpus
+            free[node][2] += r_mem
+
+        if not fits:
+            # Everything still held runs without a time limit
+            starts.append((None, None))
+            continue
+
+        node = min(fits, key=lambda x: free[x][0] - gpus)
+        free[node][0] -= gpus
+        free[node][1] -= cpus
+        free[node][2] -= mem_mb
+        starts.append((now, node))
+        if limit is not None:
+            count += 1
+            heappush(releases, (now + limit, count, node, gpus, cpus,
+                                mem_mb))
+    return starts
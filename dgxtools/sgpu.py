@@ -9,12 +9,23 @@ Author:
 Created on:
     January 16, 2020
 """
-from subprocess import Popen, PIPE
+from subprocess import Popen, PIPE, CalledProcessError
 from datetime import datetime
 from os import linesep
 from argparse import ArgumentParser
+from time import time
 import re
 
+from .topology import (get_cached_topology, build_link_masks, best_gpu_set,
+                       link_score, parse_cpu_list)
+from .job_history import JobHistory
+from .queue_wait import node_capacities, split_jobs, simulate
+
+
+HOSTS = ['dgx.cloudlab.zhaw.ch',
+         'dgx2.cloudlab.zhaw.ch',
+         'dgx3.cloudlab.zhaw.ch']
+
 
 def parse_args():
     p = ArgumentParser(description='shows all jobs in the slurm queue and their'
@@ -23,31 +34,78 @@ def parse_args():
     p.add_argument('-a', '--all', action='store_true',
                    help='runs this command on all dgx servers and shows the'
                         'results.')
+    p.add_argument('-f', '--fit', type=int, metavar='N',
+                   help='instead of listing jobs, finds the best placements '
+                        'for a job requesting N GPUs based on the current '
+                        'allocations and the NVLink/PCIe topology.')
+    p.add_argument('--history', type=float, nargs='?', const=7.,
+                   metavar='DAYS',
+                   help='instead of listing jobs, shows the GPU and CPU hours '
+                        'used by each user over the last DAYS days, 7 by '
+                        'default. Finished jobs are cached locally, so only '
+                        'new jobs are read from sacct.')
+    p.add_argument('-w', '--wait', type=int, nargs='?', const=0, metavar='N',
+                   help='instead of listing running jobs, estimates when each '
+                        'pending job starts, assuming running jobs use their '
+                        'whole time limit. If N is given, also estimates when '
+                        'a new job requesting N GPUs would start.')
 
     return p.parse_args()
 
 
-def sgpu(ssh=None):
-    """Reads from scontrol and parses the output.
+def get_jobs(ssh=None, detail=False):
+    """Reads from scontrol and parses the output into one dict per job.
 
     Args:
         ssh (str or None): If ssh is not None, then runs the scontrol command
              from that address through ssh instead.
+        detail (bool): Whether to also request the per node details, which
+             contain the indices of the GPUs allocated to each job.
+
+    Returns:
+        list: A dictionary of every key and value scontrol shows for each job.
     """
     command = []
     if ssh is not None:
         command += ['ssh', '-o', 'StrictHostKeyChecking=no', ssh]
     command += ['scontrol', 'show', 'job']
+    if detail:
+        command += ['-d']
     # Capture stream from running the scontrol command
     p = Popen(command, stdout=PIPE)
     stdout, stderror = p.communicate()
-    results = stdout.decode('UTF-8').split(linesep)
+    return parse_jobs(stdout.decode('UTF-8').split(linesep))
 
-    if len(results) == 1:
-        print('')
-        return
 
-    pattern = re.compile(r'(\S+)=(\S*)')
+def get_nodes(ssh=None):
+    """Reads the nodes from scontrol and parses them into one dict per node.
+
+    Args:
+        ssh (str or None): If ssh is not None, then runs the scontrol command
+             from that address through ssh instead.
+
+    Returns:
+        list: A dictionary of every key and value scontrol shows for each node.
+    """
+    command = []
+    if ssh is not None:
+        command += ['ssh', '-o', 'StrictHostKeyChecking=no', ssh]
+    command += ['scontrol', 'show', 'node']
+    p = Popen(command, stdout=PIPE)
+    stdout, stderror = p.communicate()
+    return parse_jobs(stdout.decode('UTF-8').split(linesep))
+
+
+def parse_jobs(results):
+    """Parses the lines of scontrol output into one dict per job.
+
+    Args:
+        results (list): The lines output by `scontrol show job`.
+
+    Returns:
+        list: A dictionary of every key and value scontrol shows for each job.
+    """
+    pattern = re.compile(r'([^\s=]+)=(\S*)')
     job_dicts = []
     current_job = {}
     for line in results:
@@ -59,6 +117,215 @@ def sgpu(ssh=None):
             if len(current_job) != 0:
                 job_dicts.append(current_job)
                 current_job = {}
+    if len(current_job) != 0:
+        job_dicts.append(current_job)
+    return job_dicts
+
+
+def get_gpu_indices(job):
+    """Gets the indices of the GPUs allocated to a job.
+
+    Requires the job to have been read with detail=True, where scontrol shows
+    the allocation as e.g. GRES=gpu(IDX:0-1,4) or, on older versions,
+    GRES_IDX=gpu(IDX:0-1,4).
+
+    Args:
+        job (dict): The job as returned by parse_jobs.
+
+    Returns:
+        list: The GPU indices, empty if none are allocated or known.
+    """
+    for key in ('GRES', 'GRES_IDX'):
+        match = re.search(r'IDX:([\d,\-]+)', job.get(key, ''))
+        if match is not None:
+            return parse_cpu_list(match.group(1))
+    return []
+
+
+def fit(n, hosts):
+    """Finds and prints the best placements of an n GPU job.
+
+    The free GPUs of each host are found using the GPU indices allocated to
+    its running jobs. Every set of n free GPUs is then ranked by the quality
+    of its interconnects. Hosts whose free GPUs best match n are preferred when
+    the interconnects are equal, so that larger free blocks stay intact.
+
+    Args:
+        n (int): The number of GPUs requested.
+        hosts (list): The hosts to check. None stands for this machine.
+    """
+    placements = []
+    memo = {}
+    for host in hosts:
+        topo = get_cached_topology(host)
+        if topo is None or not topo['gpus']:
+            print('Could not read the GPU topology of {}'.format(
+                host or 'this machine'))
+            continue
+
+        used = set()
+        for job in get_jobs(host, detail=True):
+            if job.get('JobState') == 'RUNNING':
+                used.update(get_gpu_indices(job))
+
+        free_mask = 0
+        for p, gpu in enumerate(topo['gpus']):
+            if gpu not in used:
+                free_mask |= 1 << p
+        free_count = bin(free_mask).count('1')
+
+        # Identical machines with identical allocations share a result
+        key = (tuple(sorted((a, tuple(sorted(b.items())))
+                            for a, b in topo['links'].items())), free_mask)
+        if key not in memo:
+            memo[key] = best_gpu_set(build_link_masks(topo), free_mask, n)
+        best = memo[key]
+        if best is None:
+            continue
+
+        weakest, total, chosen = best
+        gpus = [gpu for p, gpu in enumerate(topo['gpus']) if chosen >> p & 1]
+        weakest_link = '-'
+        for a in gpus:
+            for b in gpus:
+                link = topo['links'][a].get(b)
+                if link is not None and link_score(link) == weakest:
+                    weakest_link = link
+        placements.append({'host': host or 'localhost',
+                           'gpus': gpus,
+                           'weakest': weakest,
+                           'weakest_link': weakest_link,
+                           'score': total,
+                           'free_after': free_count - n})
+
+    if not placements:
+        print('No host has {} free GPUs.\n'.format(n))
+        return
+
+    placements.sort(key=lambda x: (-x['weakest'], -x['score'],
+                                   x['free_after']))
+
+    header = "{:<22.22} {:<24.24} {:>12.12} {:>6.6} {:>10.10}"
+    print('\033[47;30m'
+          + header.format('Host', 'GPUs', 'Weakest Link', 'Score',
+                          'Free After')
+          + '\033[49;39m')
+    for placement in placements:
+        print(header.format(placement['host'],
+                            ','.join(str(g) for g in placement['gpus']),
+                            placement['weakest_link'],
+                            str(placement['score']),
+                            str(placement['free_after'])))
+    print('')
+
+
+def history(days, hosts):
+    """Prints the GPU and CPU hours used by each user in the last few days.
+
+    Args:
+        days (float): How many days back to look.
+        hosts (list): The hosts to include. None stands for this machine.
+    """
+    job_history = JobHistory()
+    since = int(time() - days * 86400)
+    for host in hosts:
+        try:
+            job_history.sync(host, since)
+        except (FileNotFoundError, CalledProcessError) as e:
+            # The jobs cached so far are still shown
+            print('Could not read new jobs of {} from sacct: {}'.format(
+                host or 'this machine', e))
+
+    header = "{:<12.12} {:>6.6} {:>10.10} {:>10.10}"
+    print('\033[47;30m'
+          + header.format('UserId', 'Jobs', 'GPU-h', 'CPU-h')
+          + '\033[49;39m')
+    for user, jobs, gpu_hours, cpu_hours in \
+            job_history.usage_per_user(since, hosts):
+        print(header.format(user, str(jobs), '{:.1f}'.format(gpu_hours),
+                            '{:.1f}'.format(cpu_hours)))
+    print('')
+
+
+def format_wait(seconds):
+    """Formats seconds as e.g. '1 days 02:03:04', or 'unknown' if None."""
+    if seconds is None:
+        return 'unknown'
+    seconds = int(seconds)
+    wait = '{:02d}:{:02d}:{:02d}'.format(seconds // 3600 % 24,
+                                         seconds // 60 % 60, seconds % 60)
+    if seconds >= 86400:
+        wait = '{} days {}'.format(seconds // 86400, wait)
+    return wait
+
+
+def wait(n, hosts):
+    """Prints the estimated start time of each pending job.
+
+    Each host runs its own queue, which is simulated separately.
+
+    Args:
+        n (int): If greater than 0, also estimates the start of a new job
+            requesting n GPUs, which queues behind every pending job.
+        hosts (list): The hosts to check. None stands for this machine.
+    """
+    now = time()
+    rows = []
+    new_job = []
+    for host in hosts:
+        capacities = node_capacities(get_nodes(host))
+        running, pending = split_jobs(get_jobs(host))
+        requests = [request[1:] for request in pending]
+        if n > 0:
+            requests.append((n, 1, 0, None))
+        starts = simulate(capacities, running, requests)
+
+        for (job, gpus, _, _, _), (start, node) in zip(pending, starts):
+            rows.append((host or 'localhost', job['JobId'], job['JobName'],
+                         job['UserId'].split('(')[0], str(gpus),
+                         job.get('Priority', '0'), start, node or '-'))
+        if n > 0:
+            new_job.append((host or 'localhost', starts[-1][0],
+                            starts[-1][1] or '-'))
+
+    header = "{:<22.22} {:<7.7} {:<7.7} {:<6.6} {:>4.4} {:>10.10} " \
+             "{:>19.19} {:>18.18} {:<10.10}"
+    print('\033[47;30m'
+          + header.format('Host', 'JobId', 'JobName', 'UserId', 'GPUs',
+                          'Priority', 'Est. Start', 'Wait', 'Node')
+          + '\033[49;39m')
+    for host, job_id, name, user, gpus, priority, start, node in rows:
+        if start is None:
+            start_time = 'unknown'
+        else:
+            start_time = datetime.fromtimestamp(now + start).strftime(
+                '%d %b - %H:%M:%S')
+        print(header.format(host, job_id, name, user, gpus, priority,
+                            start_time, format_wait(start), node))
+    print('')
+
+    if new_job:
+        new_job.sort(key=lambda x: (x[1] is None, x[1] or 0))
+        print('A new job requesting {} GPUs would start:\n'.format(n))
+        for host, start, node in new_job:
+            print('{:<22.22} in {:>18.18} on {}'.format(host,
+                                                         format_wait(start),
+                                                         node))
+        print('')
+
+
+def sgpu(ssh=None):
+    """Reads from scontrol and parses the output.
+
+    Args:
+        ssh (str or None): If ssh is not None, then runs the scontrol command
+             from that address through ssh instead.
+    """
+    job_dicts = get_jobs(ssh)
+
+    if len(job_dicts) == 0:
+        print('')
+        return
 
     # Extract only the keys that we care about
     parsed_jobs = []
@@ -148,14 +415,21 @@ def sgpu(ssh=None):
     print('')
 
 
-if __name__ == '__main__':
+def main():
     args = parse_args()
-    if args.all:
-        print('dgx.cloudlab.zhaw.ch:')
-        sgpu('dgx.cloudlab.zhaw.ch')
-        print('dgx2.cloudlab.zhaw.ch:')
-        sgpu('dgx2.cloudlab.zhaw.ch')
-        print('dgx3.cloudlab.zhaw.ch:')
-        sgpu('dgx3.cloudlab.zhaw.ch')
+    if args.fit is not None:
+        fit(args.fit, HOSTS if args.all else [None])
+    elif args.history is not None:
+        history(args.history, HOSTS if args.all else [None])
+    elif args.wait is not None:
+        wait(args.wait, HOSTS if args.all else [None])
+    elif args.all:
+        for host in HOSTS:
+            print(host + ':')
+            sgpu(host)
     else:
         sgpu()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+"""Topology
+
+Reads the CPU and GPU topology of a machine. CPU to NUMA node mappings are
+read from sysfs and GPU interconnects and affinities are read from the output
+of `nvidia-smi topo -m`.
+
+Author:
+    Yvan Satyawan <y_satyawan@hotmail.com>
+
+Created on:
+    October 18, 2026
+"""
+from subprocess import Popen, PIPE
+from glob import glob
+import os
+import re
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dgxtools')
+
+# Relative quality of each connection type reported by nvidia-smi, from the
+# slowest (crossing the inter-socket link) to the fastest (a single PCIe
+# switch). NVLink connections score NVLINK_SCORE per bonded link.
+LINK_SCORES = {'SYS': 1, 'NODE': 2, 'PHB': 3, 'PXB': 4, 'PIX': 5}
+NVLINK_SCORE = 10
+
+
+def parse_cpu_list(cpulist):
+    """Parses a cpu list string such as '0-3,8,10-11' into CPU indices.
+
+    :param str cpulist: The cpu list, as used by sysfs and docker cpusets.
+    :return: Sorted list of CPU indices.
+    :rtype: list
+    """
+    cpus = set()
+    for cpu_set in cpulist.strip().split(','):
+        if not cpu_set:
+            continue
+        s = cpu_set.split('-')
+        if len(s) > 1:
+            cpus.update(range(int(s[0]), int(s[1]) + 1))
+        else:
+            cpus.add(int(s[0]))
+    return sorted(cpus)
+
+
+def format_cpu_list(cpus):
+    """Formats CPU indices back into a compact cpu list string.
+
+    :param cpus: CPU indices.
+    :type cpus: list or set
+    :return: A cpu list string such as '0-3,8'.
+    :rtype: str
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(a) if a == b else '{}-{}'.format(a, b)
+                    for a, b in ranges)
+
+
+def get_cpu_nodes(sysfs_root='/sys'):
+    """Reads which NUMA node each CPU belongs to from sysfs.
+
+    :param str sysfs_root: Where sysfs is mounted. Can be pointed at a fake
+        tree containing devices/system/node/node*/cpulist files.
+    :return: Dictionary mapping CPU index to NUMA node index. Empty if the
+        information is not available.
+    :rtype: dict
+    """
+    cpu_nodes = {}
+    pattern = os.path.join(sysfs_root, 'devices', 'system', 'node', 'node*',
+                           'cpulist')
+    for path in glob(pattern):
+        node = os.path.basename(os.path.dirname(path))[4:]
+        if not node.isdigit():
+            continue
+        with open(path) as f:
+            for cpu in parse_cpu_list(f.read()):
+                cpu_nodes[cpu] = int(node)
+    return cpu_nodes
+
+
+def parse_topology(topo_output):
+    """Parses the matrix printed by `nvidia-smi topo -m`.
+
+    :param str topo_output: The output of `nvidia-smi topo -m`.
+    :return: A dictionary containing 'gpus', a list of GPU indices, 'links', a
+        dictionary of dictionaries giving the connection type (e.g. 'NV2',
+        'PIX', 'SYS') between two GPUs, 'cpu_affinity', mapping each GPU to a
+        list of CPU indices, and 'numa_affinity', mapping each GPU to its NUMA
+        node or None if not reported.
+    :rtype: dict
+    """
+    topo = {'gpus': [], 'links': {}, 'cpu_affinity': {}, 'numa_affinity': {}}
+    # Newer drivers underline the header using escape sequences
+    topo_output = re.sub(r'\x1b\[[0-9;]*m', '', topo_output)
+
+    header = None
+    for line in topo_output.splitlines():
+        if not line.strip():
+            if header is not None:
+                break
+            continue
+        cols = [col.strip() for col in line.split('\t')]
+        if header is None:
+            header = cols
+            continue
+        match = re.match(r'GPU(\d+)$', cols[0])
+        if match is None:
+            continue
+
+        gpu = int(match.group(1))
+        topo['gpus'].append(gpu)
+        topo['links'][gpu] = {}
+        for name, value in zip(header[1:], cols[1:]):
+            peer = re.match(r'GPU(\d+)$', name)
+            if peer is not None:
+                if value != 'X':
+                    topo['links'][gpu][int(peer.group(1))] = value
+            elif name == 'CPU Affinity':
+                try:
+                    topo['cpu_affinity'][gpu] = parse_cpu_list(value)
+                except ValueError:
+                    topo['cpu_affinity'][gpu] = []
+            elif name == 'NUMA Affinity':
+                topo['numa_affinity'][gpu] = (int(value) if value.isdigit()
+                                              else None)
+    return topo
+
+
+def get_topology_output(ssh=None):
+    """Runs `nvidia-smi topo -m`.
+
+    :param ssh: If not None, runs the command on that host through ssh.
+    :type ssh: str or None
+    :return: The output of the command or None if nvidia-smi is not available.
+    :rtype: str or None
+    """
+    command = []
+    if ssh is not None:
+        command += ['ssh', '-o', 'StrictHostKeyChecking=no', ssh]
+    command += ['nvidia-smi', 'topo', '-m']
+    try:
+        p = Popen(command, stdout=PIPE)
+        stdout, stderror = p.communicate()
+    except FileNotFoundError:
+        return None
+    if p.returncode != 0:
+        return None
+    return stdout.decode('UTF-8')
+
+
+def get_topology(ssh=None):
+    """Runs `nvidia-smi topo -m` and parses its output.
+
+    :param ssh: If not None, runs the command on that host through ssh.
+    :type ssh: str or None
+    :return: The parsed topology (see parse_topology) or None if nvidia-smi
+        is not available.
+    :rtype: dict or None
+    """
+    topo_output = get_topology_output(ssh)
+    if topo_output is None:
+        return None
+    return parse_topology(topo_output)
+
+
+def get_cached_topology(ssh=None, cache_dir=CACHE_DIR):
+    """Gets the topology of a host, only querying it if it isn't cached.
+
+    The topology of a machine practically never changes, so the raw output of
+    `nvidia-smi topo -m` is kept in the cache directory for each host.
+
+    :param ssh: The host to read the topology of, None for this machine.
+    :type ssh: str or None
+    :param str cache_dir: Where cached topologies are stored.
+    :return: The parsed topology or None if it could not be read.
+    :rtype: dict or None
+    """
+    path = os.path.join(cache_dir, 'topo-{}.txt'.format(ssh or 'localhost'))
+    if os.path.exists(path):
+        with open(path) as f:
+            return parse_topology(f.read())
+
+    topo_output = get_topology_output(ssh)
+    if topo_output is None:
+        return None
+    topo = parse_topology(topo_output)
+    if topo['gpus']:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(topo_output)
+    return topo
+
+
+def gpu_numa_nodes(gpu_ids, topo, cpu_nodes):
+    """Finds the NUMA nodes the given GPUs are attached to.
+
+    Uses the NUMA affinity reported by nvidia-smi and falls back to the NUMA
+    nodes of the GPU's CPU affinity on drivers that do not report it.
+
+    :param list gpu_ids: GPU indices.
+    :param dict topo: The parsed topology.
+    :param dict cpu_nodes: CPU to NUMA node mapping from get_cpu_nodes.
+    :return: Set of NUMA node indices.
+    :rtype: set
+    """
+    nodes = set()
+    for gpu in gpu_ids:
+        node = topo['numa_affinity'].get(gpu)
+        if node is not None:
+            nodes.add(node)
+            continue
+        nodes.update(cpu_nodes[cpu]
+                     for cpu in topo['cpu_affinity'].get(gpu, [])
+                     if cpu in cpu_nodes)
+    return nodes
+
+
+def link_score(link):
+    """Gives a connection type, e.g. 'NV2' or 'SYS', a comparable score.
+
+    :param str link: The connection type from the topology matrix.
+    :rtype: int
+    """
+    if link.startswith('NV') and link[2:].isdigit():
+        return NVLINK_SCORE * int(link[2:])
+    return LINK_SCORES.get(link, 0)
+
+
+def build_link_masks(topo):
+    """Precomputes link quality bitmasks for fast searches over GPU sets.
+
+    Bit p of a mask stands for the GPU at position p of topo['gpus']. For each
+    score threshold t and each GPU p, masks[t][p] has the bits set of every
+    peer connected to p with a score of at least t. The score of a pair of GPUs
+    is the sum of the steps between thresholds their mask contains, which lets
+    the score of a whole set be computed from popcounts.
+
+    :param dict topo: The parsed topology.
+    :return: A list of (threshold, step, masks) tuples, sorted by threshold.
+    :rtype: list
+    """
+    gpus = topo['gpus']
+    scores = [[link_score(topo['links'][a].get(b, '')) for b in gpus]
+              for a in gpus]
+    thresholds = sorted({score for row in scores for score in row
+                         if score > 0})
+
+    levels = []
+    prev = 0
+    for t in thresholds:
+        masks = []
+        for row in scores:
+            mask = 0
+            for q, score in enumerate(row):
+                if score >= t:
+                    mask |= 1 << q
+            masks.append(mask)
+        levels.append((t, t - prev, masks))
+        prev = t
+    return levels
+
+
+def best_gpu_set(levels, free_mask, n):
+    """Finds the best set of n GPUs out of the free GPUs.
+
+    Sets are ranked first by their weakest link, since collective operations
+    are bottlenecked by the slowest connection, then by the total score of all
+    their links.
+
+    :param list levels: The output of build_link_masks.
+    :param int free_mask: Bitmask of free GPU positions.
+    :param int n: Number of GPUs requested.
+    :return: A tuple (weakest link score, total score, bitmask of the set), or
+        None if there are fewer than n free GPUs.
+    :rtype: tuple or None
+    """
+    free = [p for p in range(free_mask.bit_length()) if free_mask >> p & 1]
+    if len(free) < n or n <= 0:
+        return None
+    if n == 1:
+        return 0, 0, 1 << free[0]
+
+    best = [None]
+    top = levels[-1][0] if levels else 0
+
+    def search(start, chosen, weakest, total, picked):
+        if picked == n:
+            key = (weakest, total, chosen)
+            if best[0] is None or key[:2] > best[0][:2]:
+                best[0] = key
+            return
+        for i in range(start, len(free) - (n - picked) + 1):
+            p = free[i]
+            new_total = total
+            link = 0
+            for t, step, masks in levels:
+                common = masks[p] & chosen
+                new_total += step * bin(common).count('1')
+                if common == chosen:
+                    link = t
+            new_weakest = min(weakest, link) if chosen else top
+            # Prune sets that can no longer beat the best weakest link
+            if best[0] is not None and picked > 0 \
+                    and new_weakest < best[0][0]:
+                continue
+            search(i + 1, chosen | 1 << p, new_weakest, new_total,
+                   picked + 1)
+
+    search(0, 0, top, 0, 0)
+    return best[0]
@@ -21,5 +21,9 @@ setup(name='dgxtools',
       packages=['dgxtools'],
       scripts=['bin/sgpu',
                'bin/container-inspect',
-               'bin/gpu-graph'],
+               'bin/gpu-graph',
+               'bin/gpu-report',
+               'bin/gpu-idle',
+               'bin/node-overview',
+               'bin/gpu-publish'],
       zip_safe=False)
@@ -0,0 +1,140 @@
+"""Tests for the idle GPU detector.
+
+IdleDetector is driven with a fake sampler and fake holders, and every step
+is given an explicit time, so no GPUs or waiting are needed.
+"""
+import unittest
+
+from dgxtools.gpu_idle import IdleDetector
+
+
+INTERVAL = 10.
+WINDOW = 60.
+LIMIT = 300.
+
+
+class FakeGpus:
+    def __init__(self, num_gpus):
+        """Fake GPUs whose loads and holders are set by the test."""
+        self.loads = [0.] * num_gpus
+        self.holders = []
+
+    def sample(self):
+        return list(self.loads)
+
+    def get_holders(self):
+        return list(self.holders)
+
+
+def holder(holder_id, gpus, kind='job'):
+    return {'kind': kind, 'id': holder_id, 'user': 'alice', 'gpus': gpus}
+
+
+class TestIdleDetector(unittest.TestCase):
+    def setUp(self):
+        self.gpus = FakeGpus(4)
+        self.detector = IdleDetector(self.gpus.sample, self.gpus.get_holders,
+                                     interval=INTERVAL, window=WINDOW,
+                                     limit=LIMIT, idle_threshold=5.,
+                                     active_threshold=20.)
+        self.now = 0.
+
+    def run_for(self, seconds, loads=None):
+        """Steps every interval for the given seconds.
+
+        :return: The events emitted, as (time, event, id) tuples.
+        """
+        if loads is not None:
+            self.gpus.loads[:] = loads
+        events = []
+        end = self.now + seconds
+        while self.now < end:
+            events += [(self.now, e['event'], e['id'])
+                       for e in self.detector.step(self.now)]
+            self.now += INTERVAL
+        return events
+
+    def test_flagged_once_after_limit(self):
+        self.gpus.holders = [holder('1', [0, 1])]
+        self.detector.refresh_holders(self.now)
+
+        events = self.run_for(1000, [1., 2., 90., 90.])
+        # Idle from the first step at 0, so flagged once the limit is reached
+        self.assertEqual(events, [(LIMIT, 'idle', '1')])
+
+    def test_busy_gpu_keeps_holder_active(self):
+        self.gpus.holders = [holder('1', [0, 1]), holder('2', [2])]
+        self.detector.refresh_holders(self.now)
+
+        # A holder is only idle once all of its GPUs are
+        events = self.run_for(1000, [0., 50., 0., 0.])
+        self.assertEqual(events, [(LIMIT, 'idle', '2')])
+
+    def test_hysteresis(self):
+        self.gpus.holders = [holder('1', [0])]
+        self.detector.refresh_holders(self.now)
+        self.assertEqual(self.run_for(LIMIT + INTERVAL, [0., 0., 0., 0.]),
+                         [(LIMIT, 'idle', '1')])
+
+        # Utilization between the thresholds neither ends nor repeats the
+        # idle report
+        self.assertEqual(self.run_for(1000, [12., 0., 0., 0.]), [])
+
+        # Rising above the active threshold ends it once the window average
+        # does. Two samples at 50 and four at 12 average above 20.
+        start = self.now
+        self.assertEqual(self.run_for(WINDOW, [50., 0., 0., 0.]),
+                         [(start + INTERVAL, 'active', '1')])
+
+        # And going idle again takes the full limit again. The average drops
+        # below 5 once the window only holds idle samples, at the sixth step.
+        start = self.now
+        events = self.run_for(1000, [0., 0., 0., 0.])
+        self.assertEqual(events,
+                         [(start + WINDOW - INTERVAL + LIMIT, 'idle', '1')])
+
+    def test_between_thresholds_before_flagged(self):
+        self.gpus.holders = [holder('1', [0])]
+        self.detector.refresh_holders(self.now)
+        self.run_for(100, [0., 0., 0., 0.])
+
+        # Once idle, a load below the active threshold doesn't reset the time
+        # it has been idle for
+        self.assertEqual(self.run_for(1000, [12., 0., 0., 0.]),
+                         [(LIMIT, 'idle', '1')])
+
+    def test_released(self):
+        self.gpus.holders = [holder('1', [0]), holder('box', [1],
+                                                      'container')]
+        self.detector.refresh_holders(self.now)
+        self.run_for(LIMIT + INTERVAL, [0., 80., 0., 0.])
+
+        # A flagged holder that lets go of its GPUs is reported, one that
+        # wasn't flagged isn't
+        self.gpus.holders = []
+        events = self.detector.refresh_holders(self.now)
+        self.assertEqual([(e['event'], e['kind'], e['id']) for e in events],
+                         [('released', 'job', '1')])
+        self.assertEqual(events[0]['idle_seconds'], self.now)
+        self.assertEqual(self.detector.states, {})
+
+        # And isn't reported again
+        self.assertEqual(self.detector.refresh_holders(self.now), [])
+
+    def test_window_bounds(self):
+        self.gpus.holders = [holder('1', [0, 7])]
+        self.detector.refresh_holders(self.now)
+        self.run_for(1000, [0., 0., 0., 0.])
+        self.assertEqual([len(window) for window in self.detector.windows],
+                         [WINDOW / INTERVAL] * 4)
+
+        # GPUs that appear later get their own window, and GPUs that were
+        # never sampled don't count towards a holder
+        self.gpus.loads.append(0.)
+        self.run_for(INTERVAL)
+        self.assertEqual(len(self.detector.windows), 5)
+        self.assertEqual(self.detector.states[('job', '1')]['load'], 0.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""Tests for the job history cache.
+
+JobHistory is driven by a fake sacct that replays recorded sacct output, so
+the tests check which ranges each sync asks sacct for and what ends up in the
+cache.
+"""
+from subprocess import CalledProcessError
+from unittest import mock
+import unittest
+
+from dgxtools.job_history import (JobHistory, SYNC_OVERLAP, parse_sacct,
+                                  parse_time)
+
+
+# Recorded with sacct -a -X -n -P --state=CA,CD,DL,F,NF,OOM,PR,TO and
+# --format=JobID,JobName,User,State,Start,End,ElapsedRaw,AllocCPUS,AllocTRES
+SACCT_OUTPUT = '''\
+4101|train_resnet|alice|COMPLETED|2026-10-12T08:00:00|2026-10-12T20:00:00|43200|16|billing=16,cpu=16,gres/gpu=2,mem=64G,node=1
+4102|preprocess|bob|FAILED|2026-10-14T09:30:00|2026-10-14T10:00:00|1800|8|billing=8,cpu=8,mem=32G,node=1
+4103|bert_finetune|alice|CANCELLED by 1001|2026-10-15T22:00:00|2026-10-16T04:00:00|21600|32|billing=32,cpu=32,gres/gpu:v100=4,gres/gpu=4,mem=256G,node=1
+4104|eval|carol|TIMEOUT|2026-10-16T12:00:00|2026-10-16T14:00:00|7200|4|billing=4,cpu=4,gres/gpu=1,mem=16000M,node=1
+4105|train_gan|bob|COMPLETED|2026-10-17T06:00:00|2026-10-17T18:00:00|43200|8|billing=8,cpu=8,gres/gpu=1,mem=48G,node=1
+'''.splitlines()
+
+
+def end_of(line):
+    return parse_time(line.split('|')[5])
+
+
+class FakeSacct:
+    def __init__(self, lines):
+        """Replays recorded sacct output as of a settable time.
+
+        Like sacct, only jobs that ended between the start time and now are
+        returned. Each call is recorded.
+        """
+        self.lines = lines
+        self.now = 0
+        self.calls = []
+        self.error = None
+
+    def __call__(self, start, ssh=None):
+        self.calls.append((start, ssh))
+        if self.error is not None:
+            raise self.error
+        return [line for line in self.lines
+                if start <= end_of(line) <= self.now]
+
+
+class TestParseSacct(unittest.TestCase):
+    def test_recorded_output(self):
+        jobs = {job[0]: job for job in parse_sacct(SACCT_OUTPUT)}
+        self.assertEqual(len(jobs), 5)
+        self.assertEqual(jobs['4101'][8:], (2, 64 * 1024))
+        self.assertEqual(jobs['4102'][8:], (0, 32 * 1024))
+        # The typed GPUs aren't counted twice
+        self.assertEqual(jobs['4103'][8:], (4, 256 * 1024))
+        self.assertEqual(jobs['4103'][3], 'CANCELLED')
+        self.assertEqual(jobs['4104'][8:], (1, 16000))
+
+
+class TestJobHistory(unittest.TestCase):
+    def setUp(self):
+        self.sacct = FakeSacct(SACCT_OUTPUT)
+        self.history = JobHistory(':memory:', self.sacct)
+
+    def sync(self, now, since, host=None):
+        """Syncs as if the time were now."""
+        self.sacct.now = now
+        with mock.patch('dgxtools.job_history.time', return_value=now):
+            return self.history.sync(host, since)
+
+    def job_ids(self):
+        return sorted(row[0] for row in self.history.db.execute(
+            'SELECT job_id FROM jobs'))
+
+    def syncs(self, host='localhost'):
+        return self.history.db.execute(
+            'SELECT covered, synced FROM syncs WHERE host = ?',
+            (host,)).fetchone()
+
+    def test_initial_incremental_and_widened_sync(self):
+        first = parse_time('2026-10-16T18:00:00')
+        since = parse_time('2026-10-14T00:00:00')
+
+        # The first sync fetches everything since the requested time
+        self.assertEqual(self.sync(first, since), 3)
+        self.assertEqual(self.sacct.calls, [(since, None)])
+        self.assertEqual(self.job_ids(), ['4102', '4103', '4104'])
+        self.assertEqual(self.syncs(), (since, first))
+
+        # Later syncs only ask for what ended since the last one
+        second = parse_time('2026-10-17T20:00:00')
+        self.assertEqual(self.sync(second, since), 1)
+        self.assertEqual(self.sacct.calls[-1], (first - SYNC_OVERLAP, None))
+        self.assertEqual(self.job_ids(), ['4102', '4103', '4104', '4105'])
+        self.assertEqual(self.syncs(), (since, second))
+
+        # Asking for a wider range goes back to the new start
+        third = parse_time('2026-10-17T21:00:00')
+        wider = parse_time('2026-10-10T00:00:00')
+        self.assertEqual(self.sync(third, wider), 5)
+        self.assertEqual(self.sacct.calls[-1], (wider, None))
+        self.assertEqual(self.job_ids(),
+                         ['4101', '4102', '4103', '4104', '4105'])
+        self.assertEqual(self.syncs(), (wider, third))
+
+        usage = {user: (jobs, gpu_hours) for user, jobs, gpu_hours, _
+                 in self.history.usage_per_user(wider)}
+        self.assertEqual(usage, {'alice': (2, 2 * 12 + 4 * 6),
+                                 'bob': (2, 12),
+                                 'carol': (1, 2)})
+
+    def test_failed_sync_keeps_range(self):
+        first = parse_time('2026-10-16T18:00:00')
+        since = parse_time('2026-10-14T00:00:00')
+        self.sync(first, since)
+
+        self.sacct.error = CalledProcessError(1, ['sacct'])
+        with self.assertRaises(CalledProcessError):
+            self.sync(parse_time('2026-10-17T20:00:00'), since)
+        self.assertEqual(self.syncs(), (since, first))
+
+        # The next successful sync picks up the jobs the failed one missed
+        self.sacct.error = None
+        self.assertEqual(self.sync(parse_time('2026-10-17T21:00:00'), since),
+                         1)
+        self.assertEqual(self.sacct.calls[-1], (first - SYNC_OVERLAP, None))
+        self.assertIn('4105', self.job_ids())
+
+    def test_missing_sacct_caches_nothing(self):
+        self.sacct.error = FileNotFoundError('sacct')
+        with self.assertRaises(FileNotFoundError):
+            self.sync(parse_time('2026-10-16T18:00:00'),
+                      parse_time('2026-10-14T00:00:00'), 'dgx2')
+        self.assertIsNone(self.syncs('dgx2'))
+        self.assertEqual(self.job_ids(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""Tests for the GPU topology and NUMA affinity checks.
+
+The CPU layout is read from a fake sysfs tree and the GPU topology from the
+recorded output of `nvidia-smi topo -m` on a DGX-1 in tests/data.
+"""
+from itertools import combinations
+import os
+import random
+
+import pytest
+
+from dgxtools.container_inspect import check_affinity, suggest_cpuset
+from dgxtools.topology import (best_gpu_set, build_link_masks, get_cpu_nodes,
+                               gpu_numa_nodes, link_score, parse_cpu_list,
+                               parse_topology)
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# CPU lists of the two NUMA nodes of a DGX-1, with hyperthreads
+NODE_CPULISTS = {0: '0-19,40-59', 1: '20-39,60-79'}
+
+
+@pytest.fixture
+def cpu_nodes(tmp_path):
+    """Reads the CPU layout of a DGX-1 from a fake sysfs tree."""
+    node_dir = tmp_path / 'devices' / 'system' / 'node'
+    for node, cpulist in NODE_CPULISTS.items():
+        (node_dir / 'node{}'.format(node)).mkdir(parents=True)
+        (node_dir / 'node{}'.format(node) / 'cpulist').write_text(
+            cpulist + '\n')
+    # Files next to the nodes that aren't nodes
+    (node_dir / 'possible').write_text('0-1\n')
+    (node_dir / 'node_extra').mkdir()
+    (node_dir / 'node_extra' / 'cpulist').write_text('80-83\n')
+    return get_cpu_nodes(str(tmp_path))
+
+
+@pytest.fixture
+def topo():
+    with open(os.path.join(DATA_DIR, 'dgx1_topo.txt')) as f:
+        return parse_topology(f.read())
+
+
+def container(name, cpus, gpus):
+    return {'Name': name, 'CpusUsed': cpus, 'GpusUsed': gpus}
+
+
+def test_get_cpu_nodes(cpu_nodes):
+    assert len(cpu_nodes) == 80
+    assert {cpu for cpu, node in cpu_nodes.items() if node == 0} \
+        == set(parse_cpu_list(NODE_CPULISTS[0]))
+    assert cpu_nodes[20] == 1 and cpu_nodes[79] == 1
+    assert 80 not in cpu_nodes
+
+
+def test_get_cpu_nodes_without_sysfs(tmp_path):
+    assert get_cpu_nodes(str(tmp_path)) == {}
+
+
+def test_parse_topology(topo):
+    assert topo['gpus'] == list(range(8))
+    assert topo['links'][0] == {1: 'NV1', 2: 'NV1', 3: 'NV2', 4: 'NV2',
+                                5: 'SYS', 6: 'SYS', 7: 'SYS'}
+    # The matrix is symmetric and NICs aren't peers
+    for a in topo['gpus']:
+        for b, link in topo['links'][a].items():
+            assert topo['links'][b][a] == link
+    assert topo['cpu_affinity'][4] == list(range(20, 40)) + list(range(60, 80))
+    assert topo['numa_affinity'] == {gpu: gpu // 4 for gpu in range(8)}
+
+
+def test_gpu_numa_nodes(topo, cpu_nodes):
+    assert gpu_numa_nodes([0, 1], topo, cpu_nodes) == {0}
+    assert gpu_numa_nodes([3, 4], topo, cpu_nodes) == {0, 1}
+    # Older drivers don't report NUMA affinity, so the CPU affinity is used
+    topo['numa_affinity'] = {}
+    assert gpu_numa_nodes([5], topo, cpu_nodes) == {1}
+
+
+def test_suggest_cpuset(cpu_nodes):
+    # CPUs already on the right node are kept, then free CPUs are used
+    assert suggest_cpuset([18, 19, 20, 21], {0}, cpu_nodes,
+                          {0, 1, 2, 3}) == '4-5,18-19'
+    # CPUs taken by other containers are only used when nothing else is left
+    taken = set(range(20, 40)) | set(range(60, 78))
+    assert suggest_cpuset([0, 1, 2, 3], {1}, cpu_nodes, taken) \
+        == '20-21,78-79'
+
+
+def test_check_affinity(topo, cpu_nodes):
+    info = [container('wrong_node', '20-27', '0, 1'),
+            container('right_node', '0-7', '2'),
+            container('no_gpus', '8-11', '-'),
+            container('no_cpuset', '', '3'),
+            container('unresolved', '12-13', ''),
+            container('spans_gpu_nodes', '0-3', '0, 4'),
+            container('straddles', '0-3,20-23', '5')]
+    mismatches = {m['Name']: m for m in check_affinity(info, cpu_nodes, topo)}
+    assert sorted(mismatches) == ['straddles', 'wrong_node']
+
+    wrong = mismatches['wrong_node']
+    assert (wrong['CpuNodes'], wrong['GpuNodes']) == ([1], [0])
+    # Avoids the CPUs of right_node, no_gpus, unresolved, and straddles
+    assert wrong['Suggested'] == '14-19,40-41'
+
+    straddles = mismatches['straddles']
+    assert (straddles['CpuNodes'], straddles['GpuNodes']) == ([0, 1], [1])
+    # Keeps its CPUs on node 1 and skips those of wrong_node
+    assert straddles['Suggested'] == '20-23,28-31'
+
+
+def brute_force(topo, free, n):
+    """Finds the best weakest link and total score by trying every set."""
+    best = None
+    for gpus in combinations(free, n):
+        scores = [link_score(topo['links'][a].get(b, ''))
+                  for a, b in combinations(gpus, 2)]
+        key = (min(scores), sum(scores))
+        if best is None or key > best:
+            best = key
+    return best
+
+
+def test_best_gpu_set(topo):
+    levels = build_link_masks(topo)
+    rng = random.Random(0)
+    free_sets = [list(range(8)), [0, 1, 2, 3], [0, 4, 5, 6, 7], [1, 3, 6]]
+    free_sets += [sorted(rng.sample(range(8), rng.randint(2, 7)))
+                  for _ in range(20)]
+
+    for free in free_sets:
+        free_mask = sum(1 << gpu for gpu in free)
+        for n in range(2, len(free) + 1):
+            weakest, total, chosen = best_gpu_set(levels, free_mask, n)
+            assert chosen & ~free_mask == 0
+            assert bin(chosen).count('1') == n
+            assert (weakest, total) == brute_force(topo, free, n)
+            assert (weakest, total) == brute_force(
+                topo, [gpu for gpu in free if chosen >> gpu & 1], n)
+
+    # Positions and GPU indices are the same on this machine
+    assert best_gpu_set(levels, 0b1011, 1)[2] == 0b1
+    assert best_gpu_set(levels, 0b1011, 4) is None